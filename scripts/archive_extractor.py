@@ -0,0 +1,292 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from loc_counter import archive_extensions, in_ignored_folder, is_countable
+from scan_log import logger
+
+# Extraction of the archives found in a tree, shared by the code statistics scripts. Every archive is
+# extracted in place, next to where it was found, and only the files it produced are searched for
+# further archives, so a tree with nested archives is walked once instead of once per nesting level.
+
+# Serialises moving extracted items into place, so archives extracted side by side never claim the
+# same name
+move_lock = threading.Lock()
+
+
+# Function to extract archives using tar, gz, or zip format
+def extract(archive, extract_to):
+    if archive.endswith(('.tar', '.tar.gz', '.tar.bz2', '.tgz')):
+        with tarfile.open(archive, 'r:*') as tar:
+            tar.extractall(path=extract_to)
+    elif archive.endswith('.zip'):
+        with zipfile.ZipFile(archive, 'r') as zip_ref:
+            zip_ref.extractall(extract_to)
+    else:
+        raise ValueError("Unknown archive format")
+
+
+# Function to find the archives under a directory
+def find_archives(directory):
+    archives = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith(archive_extensions):
+                archives.append(os.path.join(root, file))
+    return archives
+
+
+# Function to return path, or path with the first free ~N suffix when something already exists there
+def unique_path(path):
+    candidate = path
+    index = 0
+    while os.path.lexists(candidate):
+        index += 1
+        candidate = f"{path}~{index}"
+    return candidate
+
+
+# Function to extract one archive into its own directory and delete it; returns the archives among
+# the extracted files. The contents are unpacked into a scratch directory beside the archive, so
+# moving them into place is a rename, and an item whose name is taken gets a ~N suffix instead of
+# replacing what is there. The archive is only deleted once every item is in place; if moving one
+# fails, it is put back
+def extract_in_place(archive):
+    directory = os.path.dirname(archive)
+    scratch_dir = tempfile.mkdtemp(prefix='.extract_', dir=directory)
+    aside = None
+    try:
+        extract(archive, scratch_dir)
+        moved = []
+        with move_lock:
+            # Moved aside first, so a member named like the archive takes its place
+            aside = unique_path(os.path.join(directory, f".{os.path.basename(archive)}.extracted"))
+            os.rename(archive, aside)
+            for item in os.listdir(scratch_dir):
+                destination = unique_path(os.path.join(directory, item))
+                os.rename(os.path.join(scratch_dir, item), destination)
+                moved.append(destination)
+        os.remove(aside)
+        aside = None
+    finally:
+        if aside is not None:
+            with move_lock:
+                os.rename(aside, unique_path(archive))
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    archives = []
+    for path in moved:
+        if os.path.isdir(path):
+            archives.extend(find_archives(path))
+        elif path.endswith(archive_extensions):
+            archives.append(path)
+    return archives
+
+
+# Function to extract every archive under search_dir, including the archives inside them, with up to
+# workers archives extracted at once. The tree is walked once; after that, only the contents of each
+# extracted archive are searched. Returns the number of archives of each type
+def extract_all_archives(search_dir, workers=1):
+    archive_types = Counter()
+    with ThreadPoolExecutor(max(workers, 1)) as executor:
+        pending = {}
+        queue = find_archives(search_dir)
+        while queue or pending:
+            while queue:
+                archive = queue.pop()
+                logger.info(f"Found archive: {archive}")
+                archive_types[os.path.splitext(archive)[-1].lower()] += 1
+                pending[executor.submit(extract_in_place, archive)] = archive
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                archive = pending.pop(future)
+                try:
+                    queue.extend(future.result())
+                except Exception as e:
+                    logger.error(f"Error: Failed to extract archive '{archive}': {e}")
+                    exit(1)
+    return archive_types
+
+
+# Default cap on the bytes extracted into the scratch directory at once (see ExtractionPipeline)
+scratch_limit = 1 << 30
+
+# Expected expansion of bz2 archives, which do not record their uncompressed size
+bz2_expansion = 8
+
+
+# Function to estimate the bytes an archive takes once extracted, without decompressing it
+def estimate_extracted_size(archive):
+    size = os.path.getsize(archive)
+    if archive.endswith('.zip'):
+        with zipfile.ZipFile(archive, 'r') as zip_ref:
+            return sum(info.file_size for info in zip_ref.infolist())
+    if archive.endswith(('.tar.gz', '.tgz')) and size >= 4:
+        # gzip ends with the uncompressed size modulo 2**32
+        with open(archive, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return max(int.from_bytes(f.read(4), 'little'), size)
+    if archive.endswith('.tar.bz2'):
+        return size * bz2_expansion
+    return size
+
+
+# Function to extract an archive into a new directory under scratch_root (run in the extraction
+# pool); returns the directory, the (relative path, size) of the extracted files other than
+# archives, the relative paths of the nested archives and the bytes extracted
+def extract_to_scratch(archive, scratch_root):
+    scratch_dir = tempfile.mkdtemp(prefix='extract_', dir=scratch_root)
+    try:
+        extract(archive, scratch_dir)
+    except BaseException:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
+    files = []
+    archives = []
+    extracted_bytes = 0
+    for root, _, names in os.walk(scratch_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, scratch_dir)
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            extracted_bytes += size
+            if name.endswith(archive_extensions):
+                archives.append(relative_path)
+            else:
+                files.append((relative_path, size))
+    return scratch_dir, files, archives, extracted_bytes
+
+
+# Extraction pipelined with counting. Archives are extracted by a pool into a scratch directory
+# while the files already available are counted; every extracted file is reported at the path
+# in-place extraction would have given it, and each scratch directory is deleted as soon as its files
+# have been counted and its nested archives extracted. New extractions wait while the scratch
+# directory holds limit bytes, unless nothing is in progress that could free any; nested archives
+# are extracted first, so the directories holding them are freed early. count_files(entries) is
+# given batches of (file to read, path to report) entries and returns a future, whose result is
+# passed to on_counted() when it is given
+class ExtractionPipeline:
+    def __init__(self, extract_pool, workers, scratch_root, limit, count_files, on_counted, search_dir,
+                 batch_bytes, batch_files):
+        self.extract_pool = extract_pool
+        self.workers = max(workers, 1)
+        self.scratch_root = scratch_root
+        self.limit = limit
+        self.count_files = count_files
+        self.on_counted = on_counted
+        self.search_dir = search_dir
+        self.batch_bytes = batch_bytes
+        self.batch_files = batch_files
+        self.archive_types = Counter()
+        self.waiting = []    # (archive, reported path, enclosing scratch directory, estimated size)
+        self.futures = {}    # future -> ('extract', waiting entry) or ('count', scratch directory)
+        self.scratches = {}  # scratch directory -> {'pending', 'reserved'}
+        self.reserved = 0    # bytes held by the scratch directories and the extractions in progress
+        self.extracting = 0
+
+    # Queue an archive found at the given path; archives found in the tree are reported where they are
+    def add_archive(self, archive, reported_path=None, parent=None):
+        reported_path = reported_path or archive
+        logger.info(f"Found archive: {reported_path}")
+        self.archive_types[os.path.splitext(archive)[-1].lower()] += 1
+        self.waiting.append((archive, reported_path, parent, estimate_extracted_size(archive)))
+        self.start_extractions()
+
+    # Count a batch of loose (file to read, path to report) entries
+    def add_files(self, entries):
+        self.futures[self.count_files(entries)] = ('count', None)
+
+    def fits(self, entry):
+        return self.limit is None or self.reserved + entry[3] <= self.limit or not self.futures
+
+    def start_extractions(self):
+        while self.extracting < self.workers:
+            entry = next((entry for entry in reversed(self.waiting) if self.fits(entry)), None)
+            if entry is None:
+                return
+            self.waiting.remove(entry)
+            self.reserved += entry[3]
+            self.extracting += 1
+            self.futures[self.extract_pool.submit(extract_to_scratch, entry[0], self.scratch_root)] = ('extract', entry)
+
+    def extracted(self, entry, result):
+        archive, reported_path, parent, estimate = entry
+        scratch_dir, files, archives, extracted_bytes = result
+        self.extracting -= 1
+        self.reserved += extracted_bytes - estimate
+        self.scratches[scratch_dir] = {'pending': 0, 'reserved': extracted_bytes}
+        # The enclosing directory was only waiting for the archive to be read
+        if parent is not None:
+            self.done(parent)
+        # Contents are reported where in-place extraction would have put them
+        reported_dir = os.path.dirname(reported_path)
+        batch = []
+        batch_size = 0
+        for relative_path, size in files:
+            path = os.path.join(reported_dir, relative_path)
+            if in_ignored_folder(os.path.relpath(path, self.search_dir)) or not is_countable(path):
+                continue
+            batch.append((os.path.join(scratch_dir, relative_path), path))
+            batch_size += size
+            if batch_size >= self.batch_bytes or len(batch) >= self.batch_files:
+                self.count(scratch_dir, batch)
+                batch = []
+                batch_size = 0
+        if batch:
+            self.count(scratch_dir, batch)
+        for relative_path in archives:
+            self.scratches[scratch_dir]['pending'] += 1
+            self.add_archive(os.path.join(scratch_dir, relative_path), os.path.join(reported_dir, relative_path), scratch_dir)
+        if not self.scratches[scratch_dir]['pending']:
+            self.release(scratch_dir)
+
+    def count(self, scratch_dir, entries):
+        self.scratches[scratch_dir]['pending'] += 1
+        self.futures[self.count_files(entries)] = ('count', scratch_dir)
+
+    def done(self, scratch_dir):
+        self.scratches[scratch_dir]['pending'] -= 1
+        if not self.scratches[scratch_dir]['pending']:
+            self.release(scratch_dir)
+
+    def release(self, scratch_dir):
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        self.reserved -= self.scratches.pop(scratch_dir)['reserved']
+
+    # Handle the extractions and counts completed so far, waiting up to timeout seconds for one
+    def poll(self, timeout=0):
+        self.start_extractions()
+        if not self.futures:
+            return
+        done, _ = wait(self.futures, timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, item = self.futures.pop(future)
+            if kind == 'extract':
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error: Failed to extract archive '{item[1]}': {e}")
+                    exit(1)
+                self.extracted(item, result)
+            else:
+                result = future.result()
+                if self.on_counted is not None:
+                    self.on_counted(result)
+                if item is not None:
+                    self.done(item)
+        self.start_extractions()
+
+    # Wait for every archive to be extracted and every file to be counted
+    def finish(self):
+        while self.futures or self.waiting:
+            self.poll(None)
+
+    # Delete the scratch directories left behind by an interrupted run
+    def close(self):
+        for scratch_dir in list(self.scratches):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
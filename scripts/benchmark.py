@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import create_random_files
+import loc_counter
+import validate_report
+
+# Generates fixed-seed corpora with create_random_files.py, runs the scanners against them, checks
+# the reports against the generator's ground truth and appends wall time, throughput and peak RSS
+# to a history file so that regressions show up from one run to the next.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Approximate number of files in a corpus of each scale
+corpus_scales = {'1k': 1000, '10k': 10000, '100k': 100000, '1M': 1000000}
+
+# Maximum directory depth of each corpus shape; every directory becomes an archive, so this is also
+# the deepest archive nesting
+corpus_shapes = {'shallow': 2, 'deep': 8}
+
+# Number of files the generator writes in every directory
+files_per_directory = 20
+
+# Scanners: script, options and whether the report can be checked against the ground truth
+scanners = {
+    'serial': ('code_statistics.py', ['--quiet'], True),
+    'stream': ('code_statistics.py', ['--stream', '--quiet'], True),
+    'stream-fast': ('code_statistics.py', ['--stream', '--fast', '--quiet'], True),
+    'multiprocessing': ('code_statistics_multiprocessing.py', ['--quiet'], True),
+    'pipelined': ('code_statistics_multiprocessing.py', ['--scratch-dir', '--quiet'], True),
+    'combined': ('code_statistics.py', ['--stream', '--analyze', 'terms', '--quiet'], True),
+    'term-search': ('proprietary_term_search.py', [], False),
+}
+
+# Report written next to the scripts by proprietary_term_search.py; moved into the run directory
+term_report_path = os.path.join(script_dir, 'proprietary_terms_statistics.txt')
+
+# Name of the history file, one JSON record per scanner run, kept in the work directory by default
+history_file_name = 'benchmark_history.jsonl'
+
+
+# Function to generate a corpus and its ground truth unless an earlier run already did; returns the
+# paths of the tree and of the generation statistics
+def ensure_corpus(work_dir, scale, shape, seed, workers=1):
+    corpus_dir = os.path.join(work_dir, f"corpus-{scale}-{shape}-{seed}")
+    tree_dir = os.path.join(corpus_dir, 'tree')
+    statistics_path = os.path.join(corpus_dir, 'generation_statistics.txt')
+    if os.path.exists(statistics_path):
+        return tree_dir, statistics_path
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    max_depth = corpus_shapes[shape]
+    # Each top-level directory holds between 1 and max_depth nested directories of files
+    num_subdirs = max(1, round(corpus_scales[scale] / (files_per_directory * (max_depth + 1) / 2)))
+    print(f"Generating {scale} {shape} corpus in {corpus_dir}")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        statistics = create_random_files.create_files_in_directory(tree_dir, num_subdirs, files_per_directory, max_depth, seed, workers, in_memory=True)
+    # Written last, so an interrupted generation is started over
+    create_random_files.write_statistics_to_file(statistics, statistics_path, tree_dir, num_subdirs, files_per_directory, max_depth)
+    return tree_dir, statistics_path
+
+
+# Function to run a scanner; returns (exit code, wall time in seconds, peak RSS in KB). The RSS is
+# that of the largest process of the scanner, pool workers included
+def run_scanner(command):
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=script_dir, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, wall_time, rusage.ru_maxrss
+
+
+# Function to return the current commit of the repository, or None outside of a git checkout
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+# Function to find the last recorded run of the same benchmark in the history file
+def previous_record(history_path, record):
+    previous = None
+    if not os.path.exists(history_path):
+        return None
+    with open(history_path, 'r') as history_file:
+        for line in history_file:
+            entry = json.loads(line)
+            if all(entry.get(key) == record[key] for key in ('scale', 'shape', 'seed', 'scanner')):
+                previous = entry
+    return previous
+
+
+# Function to benchmark one scanner on a corpus and return its history record
+def benchmark_scanner(scanner, tree_dir, statistics_path, run_dir, cpus):
+    script, options, validated = scanners[scanner]
+    # Every run gets a fresh copy: extraction rewrites the tree and reports are written into it
+    shutil.rmtree(run_dir, ignore_errors=True)
+    shutil.copytree(tree_dir, run_dir)
+    corpus_bytes = loc_counter.directory_size(run_dir)
+    if script == 'code_statistics_multiprocessing.py':
+        options = options + ['--cpus', str(cpus)]
+
+    exit_code, wall_time, peak_rss = run_scanner([sys.executable, script, run_dir] + options)
+    if os.path.exists(term_report_path):
+        shutil.move(term_report_path, os.path.join(run_dir, os.path.basename(term_report_path)))
+
+    expected = validate_report.parse_report(statistics_path)
+    if exit_code != 0:
+        valid = False
+    elif validated:
+        actual = validate_report.parse_report(os.path.join(run_dir, 'codebase_report.txt'))
+        mismatches = validate_report.compare_reports(expected, actual)
+        for mismatch in mismatches:
+            print(f"\t{mismatch}")
+        valid = not mismatches
+    else:
+        valid = None  # completed, but there is no ground truth to compare against
+    return {
+        'files': expected['total_files'],
+        'bytes': corpus_bytes,
+        'wall_s': round(wall_time, 3),
+        'files_per_s': round(expected['total_files'] / wall_time, 1),
+        'bytes_per_s': round(corpus_bytes / wall_time),
+        'peak_rss_kb': peak_rss,
+        'valid': valid,
+    }
+
+
+# Main script execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scanners on generated corpora and record the results")
+    parser.add_argument("--scales", nargs="+", choices=list(corpus_scales), default=['1k'], help="Corpus sizes to benchmark (default: 1k)")
+    parser.add_argument("--shapes", nargs="+", choices=list(corpus_shapes), default=list(corpus_shapes), help="Corpus shapes: shallow or deeply nested archives (default: both)")
+    parser.add_argument("--scanners", nargs="+", choices=list(scanners), default=list(scanners), help="Scanners to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated corpora (default: 0)")
+    parser.add_argument("--cpus", type=int, default=os.cpu_count(), help="Worker processes for the multiprocessing scanner and the corpus generator (default: number of CPUs)")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), 'codestatistics_benchmark'), help="Directory for the corpora, which are kept and reused by later runs, and the scanner runs")
+    parser.add_argument("--history", help=f"File the results are appended to as JSON lines (default: {history_file_name} in the work directory)")
+
+    args = parser.parse_args()
+    os.makedirs(args.work_dir, exist_ok=True)
+    history_path = args.history or os.path.join(args.work_dir, history_file_name)
+
+    commit = git_commit()
+    run_dir = os.path.join(args.work_dir, 'run')
+    failed = False
+    for scale in args.scales:
+        for shape in args.shapes:
+            tree_dir, statistics_path = ensure_corpus(args.work_dir, scale, shape, args.seed, args.cpus)
+            for scanner in args.scanners:
+                record = {
+                    'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                    'commit': commit,
+                    'scale': scale,
+                    'shape': shape,
+                    'seed': args.seed,
+                    'scanner': scanner,
+                }
+                record.update(benchmark_scanner(scanner, tree_dir, statistics_path, run_dir, args.cpus))
+                failed = failed or record['valid'] is False
+
+                previous = previous_record(history_path, record)
+                change = ''
+                if previous is not None:
+                    change = f", {100 * (record['wall_s'] / previous['wall_s'] - 1):+.1f}% vs {previous.get('commit') or previous['timestamp']}"
+                status = {True: 'OK', False: 'FAIL', None: 'done'}[record['valid']]
+                print(f"{status:4} {scale} {shape} {scanner}: {record['wall_s']:.2f}s, {record['files_per_s']:.0f} files/s, "
+                      f"{record['bytes_per_s'] / 1e6:.1f} MB/s, {record['peak_rss_kb']} KB peak RSS{change}")
+                with open(history_path, 'a') as history_file:
+                    history_file.write(json.dumps(record) + '\n')
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
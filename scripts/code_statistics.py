@@ -1,220 +1,306 @@
 import os
 import tarfile
 import zipfile
+import argparse
+import sys
 import tempfile
-import shutil
-from collections import defaultdict
-
-# Dictionary of folder names
-folder_names = {
-    "git": [".git"],
-    # "config": [".config"],
-    # "cache": [".cache"],
-    # Add more folder names as needed
-}
-
-folder_names_list = [name for names in folder_names.values() for name in names]
-
-# Function to extract archives using tar, gz, or zip format
-def extract(archive, extract_to):
-    try:
-        if archive.endswith(('.tar', '.tar.gz', '.tar.bz2', '.tgz')):
-            with tarfile.open(archive, 'r:*') as tar:
-                tar.extractall(path=extract_to)
-        elif archive.endswith('.zip'):
-            with zipfile.ZipFile(archive, 'r') as zip_ref:
-                zip_ref.extractall(extract_to)
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import archive_extractor
+import loc_counter
+import scan_cache
+import content_sniffer
+import file_analyzers
+import scan_log
+from scan_log import logger
+from loc_counter import archive_extensions, folder_names_list
+
+# Function to check a file for binary contents before counting it. Returns the bytes already read
+# from the stream, or None when the file is a binary and has been recorded as skipped
+def sniff_file(file, stats, stream=None, size=None):
+    if stream is None:
+        binary, bytes_read = content_sniffer.sniff_file(file)
+        head = b''
+    else:
+        binary, head = content_sniffer.sniff_stream(file, stream)
+        bytes_read = len(head)
+    if not binary:
+        return head
+    if size is None:
+        size = os.path.getsize(file)
+    loc_counter.add_skipped_binary(stats, size - bytes_read)
+    if records_file is not None:
+        records_file.write(loc_counter.format_record(file, 'binary', size=size))
+    logger.debug("Skipped binary file %s", file)
+    return None
+
+
+# Function to count lines of code and update statistics for each language; archive members are
+# passed in as binary streams of the given size. Returns None for binary files
+def count_loc(file, stats, stream=None, size=None):
+    # With analyzers, loose files are read as streams too, so their contents pass through them
+    if analyzers and stream is None:
+        with open(file, 'rb') as f:
+            return count_loc(file, stats, f, os.fstat(f.fileno()).st_size)
+
+    # Loose files are looked up in the incremental cache first
+    counts = None
+    if cache is not None and stream is None:
+        counts = scan_cache.lookup_file(cache, file)
+    if counts is None:
+        head = sniff_file(file, stats, stream, size)
+        if head is None:
+            return None
+        if analyzers:
+            stream = file_analyzers.AnalyzedStream(stream, analyzers, file, head)
+    if counts is not None:
+        status = 'cached'
+    elif unique_stats is not None:
+        # Identical contents are classified once and reuse the counts of the first copy
+        if stream is None:
+            with open(file, 'rb') as f:
+                data = f.read()
         else:
-            print(f"Error: Unknown archive format for file '{archive}'", file=sys.stderr)
-            exit(1)
-    except Exception as e:
-        print(f"Error: Failed to extract archive '{archive}': {e}", file=sys.stderr)
-        exit(1)
-
-
-# Function to determine the language of a file based on its extension
-def get_lang(file):
-    return file.split('.')[-1].lower()
-
-
-# Comment symbols for each file extension
-comment_symbols = {
-    '.py': ('#', ('"""', '"""')),
-    '.cjs': ('//', ('/*', '*/')),
-    '.js': ('//', ('/*', '*/')),
-    '.mjs': ('//', ('/*', '*/')),
-    '.ts': ('//', ('/*', '*/')),
-    '.tsx': ('//', ('/*', '*/')),
-    '.c': ('//', ('/*', '*/')),
-    '.h': ('//', ('/*', '*/')),
-    '.cpp': ('//', ('/*', '*/')),
-    '.cc': ('//', ('/*', '*/')),
-    '.cxx': ('//', ('/*', '*/')),
-    '.hpp': ('//', ('/*', '*/')),
-    '.hxx': ('//', ('/*', '*/')),
-    '.h++': ('//', ('/*', '*/')),
-    '.inl': ('//', ('/*', '*/')),
-    '.ipp': ('//', ('/*', '*/')),
-    '.tcc': ('//', ('/*', '*/')),
-    '.tpp': ('//', ('/*', '*/')),
-    '.java': ('//', ('/*', '*/')),
-    '.r': ('#', ('/*', '*/')),
-    '.rdata': ('#', ('/*', '*/')),
-    '.rds': ('#', ('/*', '*/'))
-}
-
-
-# Function to count lines of code and update statistics for each language
-def count_loc(file, lang_stats):
-    global tot_loc
-    extension = os.path.splitext(file)[1].lower()
-
-    # Assuming 'loc', 'file', 'extension', and 'comment_loc' are already defined in your context
-    if not extension:
-        extension = os.path.basename(file)
-
-    single_line_comment_symbol, multi_line_comment_symbols = comment_symbols.get(extension, ('#', ('"""', '"""')))
-
-    loc = 0
-    comment_loc = 0
-    in_multi_line_comment = False
-
-    with open(file, 'r', errors='ignore') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                loc += 1
-                if in_multi_line_comment:
-                    comment_loc += 1
-                    if multi_line_comment_symbols[1] in line:
-                        in_multi_line_comment = False
-                elif line.startswith(multi_line_comment_symbols[0]):
-                    comment_loc += 1
-                    in_multi_line_comment = True
-                elif line.startswith(multi_line_comment_symbols[0]):
-                    comment_loc += 1
-                elif line.startswith(single_line_comment_symbol):
-                    comment_loc += 1
-
-    tot_loc += loc
-    lang_stats[extension]['total'] += loc
-    lang_stats[extension]['comments'] += comment_loc
-    lang_stats[extension]['code'] += (loc - comment_loc)
-
-    print(f"Counted {loc} lines in {file} (extension: {extension}, {loc - comment_loc} code - {comment_loc} comments)")
-
-
-# Function to find archives in the search directory
-def find_archives(search_dir):
-    archives = []
-    for root, _, files in os.walk(search_dir):
-        for file in files:
-            if file.endswith(('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz')):
-                archives.append(os.path.join(root, file))
-    return archives
-
-
-# Function to recursively extract all archives
-def extract_all_archives(search_dir):
-    archive_types = defaultdict(int)
-
-    while True:
-        archives = find_archives(search_dir)
-        if not archives:
-            break
-
-        for archive in archives:
-            print(f"Found archive: {archive}")
-            archive_type = os.path.splitext(archive)[-1].lower()
-            archive_types[archive_type] += 1
+            data = head + stream.read()
+        counts, _, first_seen = loc_counter.count_deduplicated(file, data, blob_counts, fast_mode)
+        if first_seen:
+            status = 'counted'
+            loc_counter.add_file_counts(unique_stats, file, counts)
+        else:
+            status = 'duplicate'
+    else:
+        status = 'counted'
+        if fast_mode:
+            counts = loc_counter.count_file_bytes(file, None if stream is None else head + stream.read())
+        else:
+            counts = loc_counter.count_file(file, None if stream is None else loc_counter.iter_text_chunks(stream, head=head))
+        if cache is not None and stream is None:
+            scan_cache.store_file(cache, file, counts)
+    if analyzers:
+        stream.finish()
+    loc_counter.add_file_counts(stats, file, counts)
+    if records_file is not None:
+        records_file.write(loc_counter.format_record(file, status, counts))
+    logger.debug("%s lines in %s (%s, extension: %s, %s code - %s comments)", counts['total'], file, status,
+                 loc_counter.get_lang(file), counts['code'], counts['comments'])
+    return counts
+
+
+# Function to count every member of an archive in memory, recursing into nested archives; the
+# counts of every member are appended to records when it is given, with its path relative to the
+# outermost archive
+def stream_archive(fileobj, archive_name, archive_types, records=None, records_root=None):
+    logger.info(f"Found archive: {archive_name}")
+    archive_type = os.path.splitext(archive_name)[-1].lower()
+    archive_types[archive_type] += 1
 
-            temp_dir = tempfile.mkdtemp()
+    try:
+        for member_name, member, size in loc_counter.iter_archive_members(fileobj, archive_name):
+            member_path = f"{archive_name}/{member_name}"
+            file = os.path.basename(member_name)
+            if file.endswith(archive_extensions):
+                stream_archive(member, member_path, archive_types, records, records_root or archive_name)
+                continue
+            if not loc_counter.is_countable(file) or loc_counter.in_ignored_folder(member_name):
+                continue  # skip git files and ignored folders
+            logger.debug("Processing file: %s", member_path)
             try:
-                extract(archive, temp_dir)
-                for item in os.listdir(temp_dir):
-                    s = os.path.join(temp_dir, item)
-                    d = os.path.join(search_dir, item)
-                    if os.path.isdir(s):
-                        if os.path.exists(d):
-                            shutil.rmtree(d)
-                        shutil.move(s, d)
-                    else:
-                        shutil.move(s, d)
-            finally:
-                shutil.rmtree(temp_dir)
+                counts = count_loc(member_path, stats, member, size)
+                scan_log.advance_progress(progress, 1)
+                if records is not None and counts is not None:
+                    relative_path = member_path[len(records_root or archive_name) + 1:]
+                    records.append([relative_path] + [counts[column] for column in scan_cache.count_columns])
+            except Exception as e:
+                logger.error(f"Error processing file {member_path}: {e}")
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError, ValueError) as e:
+        logger.error(f"Error: Failed to stream archive '{archive_name}': {e}")
+        exit(1)
 
-            os.remove(archive)
 
-    return archive_types
+# Function to stream an archive found on disk, or replay its statistics from the cache when its
+# contents are unchanged
+def stream_cached_archive(archive_path, archive_types):
+    if cache is None:
+        with open(archive_path, 'rb') as f:
+            stream_archive(f, archive_path, archive_types)
+        return
+
+    digest, contents = scan_cache.lookup_archive(cache, archive_path)
+    if contents is not None:
+        logger.info(f"Cached archive: {archive_path}")
+        for record in contents['files']:
+            member_path, counts = scan_cache.unpack_record(record, archive_path)
+            loc_counter.add_file_counts(stats, member_path, counts)
+            if records_file is not None:
+                records_file.write(loc_counter.format_record(member_path, 'cached', counts))
+        archive_types.update(contents['archive_types'])
+        return
+
+    records = []
+    nested_archive_types = Counter()
+    with open(archive_path, 'rb') as f:
+        stream_archive(f, archive_path, nested_archive_types, records)
+    archive_types.update(nested_archive_types)
+    scan_cache.store_archive(cache, digest, records, nested_archive_types)
+
+
+# Function to count a batch of (file to read, path to report) entries extracted by the pipeline (see
+# archive_extractor.ExtractionPipeline); counting is done on the spot, so the future returned is done
+def count_extracted_files(entries):
+    for file_path, report_path in entries:
+        logger.debug("Processing file: %s", report_path)
+        try:
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                count_loc(report_path, stats, f, size)
+            scan_log.advance_progress(progress, 1, size)
+        except Exception as e:
+            logger.error(f"Error processing file {report_path}: {e}")
+    future = Future()
+    future.set_result(None)
+    return future
 
 
 # Function to process source code files in a single extracted directory
-def process_files_in_directory(directory):
-    global lang_stats, total_files_found, file_type_counts
-    print(f"Processing directory: {directory}")
+# Archives are handed to the extraction pipeline when one is given, streamed in memory when
+# archive_types is given, and skipped otherwise; the files of outputs (see loc_counter.scan_outputs())
+# are skipped as well
+def process_files_in_directory(directory, archive_types=None, pipeline=None, outputs=None):
+    logger.info(f"Processing directory: {directory}")
     for root, dirs, files in os.walk(directory):
         # Filter out directories you want to ignore
         dirs[:] = [d for d in dirs if d not in folder_names_list]
         for file in files:
-            if file.endswith(('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz')):
+            if file.endswith(archive_extensions):
+                if pipeline is not None:
+                    pipeline.add_archive(os.path.join(root, file))
+                elif archive_types is not None:
+                    stream_cached_archive(os.path.join(root, file), archive_types)
+                    if progress is not None:
+                        scan_log.advance_progress(progress, 0, os.path.getsize(os.path.join(root, file)))
                 continue  # Skip archive files
             if file.endswith('.gitkeep'):
                 continue  # skip git file
+            if loc_counter.is_scan_output(root, file, outputs):
+                continue  # skip the reports, records and cache of this scan and earlier ones
             file_path = os.path.join(root, file)
-            print(f"Processing file: {file_path}")
+            logger.debug("Processing file: %s", file_path)
             try:
-                count_loc(file_path, lang_stats)
-                file_type_counts[os.path.splitext(file)[1].lower()] += 1
-                total_files_found += 1
+                count_loc(file_path, stats)
+                if progress is not None:
+                    scan_log.advance_progress(progress, 1, os.path.getsize(file_path))
             except Exception as e:
-                print(f"Error processing file {file_path}: {e}", file=sys.stderr)
+                logger.error(f"Error processing file {file_path}: {e}")
+            if pipeline is not None:
+                pipeline.poll()  # count the archives extracted in the meantime
 
-# Initialize variables for the total lines of code and the language statistics
-tot_loc = 0
-total_files_found = 0
-lang_stats = defaultdict(lambda: {'total': 0, 'code': 0, 'comments': 0})
-file_type_counts = defaultdict(int)
+# Statistics for the whole run, see loc_counter.new_stats()
+stats = loc_counter.new_stats()
 
+# Classify raw bytes in bulk (loc_counter.count_buffer) instead of decoding line by line
+fast_mode = False
 
-# Function to generate the codebase report
-def create_report(report_path, archive_types):
-    with open(report_path, 'w') as report_file:
-        report_file.write(f"Total archives found: {sum(archive_types.values())}\n")
-        report_file.write("Archives by type:\n")
-        for ext, count in archive_types.items():
-            report_file.write(f"{ext}: {count}\n")
+# Incremental cache (see scan_cache.open_cache()), None when disabled
+cache = None
 
-        report_file.write(f"\nTotal files found: {total_files_found}\n")
-        report_file.write(f"Total lines of code found: {tot_loc}\n\n")
+# Statistics of distinct file contents and the counts of every blob seen so far, when deduplicating
+unique_stats = None
+blob_counts = {}
 
-        report_file.write("Files of each type found:\n")
-        for ext in sorted(file_type_counts):
-            report_file.write(f"{ext}: {file_type_counts[ext]}\n")
+# Open file the per-file JSON Lines records are streamed to, None when disabled
+records_file = None
 
-        report_file.write("\nLanguage statistics:\n")
-        for lang in sorted(lang_stats):
-            count = lang_stats[lang]['total']
-            code_count = lang_stats[lang]['code']
-            comment_count = lang_stats[lang]['comments']
-            percentage = (count / tot_loc) * 100 if tot_loc > 0 else 0
-            report_file.write(
-                f"{lang}: {count} lines [{code_count} code - {comment_count} comments] ({percentage:.2f}%)\n")
+# Progress of the scan (see scan_log.new_progress()), None when progress is not logged
+progress = None
+
+# Per-file analyzers fed the contents of every text file as it is counted (see file_analyzers)
+analyzers = []
 
 
 # Main script execution
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) != 2:
-        print("Usage: python code_statistics.py <search_directory>")
-        sys.exit(1)
-
-    search_dir = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Analyze codebase and generate statistics")
+    parser.add_argument("search_directory", help="Directory to search for code files and archives")
+    parser.add_argument("--stream", action="store_true", help="Count archive members in memory instead of extracting archives to disk (leaves the search directory untouched)")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of archives extracted at once; each is extracted in place, next to where it was found (default: 1)")
+    parser.add_argument("--scratch-dir", nargs="?", const=tempfile.gettempdir(), metavar="DIR", help="Extract archives under DIR (default: the system temporary directory) by a pool of --extract-workers processes while the files already extracted are counted, deleting them once counted; the search directory is left untouched")
+    parser.add_argument("--scratch-limit", type=int, default=archive_extractor.scratch_limit, metavar="BYTES", help="Stop starting extractions while the scratch directory holds this many bytes (default: 1 GiB)")
+    parser.add_argument("--fast", action="store_true", help="Classify lines on raw bytes in bulk instead of decoding files line by line")
+    parser.add_argument("--cache", nargs="?", const="", metavar="PATH", help=f"Reuse counts of unchanged files and archives from an incremental cache (default: {scan_cache.cache_file_name} in the search directory); archives are only cached with --stream")
+    parser.add_argument("--verify-hash", action="store_true", help="Also compare content hashes before trusting cached counts")
+    parser.add_argument("--dedup", action="store_true", help="Count files with identical contents once and also report unique lines of code per extension")
+    parser.add_argument("--jsonl", metavar="PATH", help="Stream one JSON record per file (path, language, status and line counts) to PATH while scanning")
+    parser.add_argument("--summary-csv", metavar="PATH", help="Also write the per-language statistics to PATH as CSV")
+    parser.add_argument("--log-level", choices=scan_log.log_levels, default="INFO", help="Logging level; DEBUG logs every file (default: INFO)")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings and errors, without progress lines")
+    parser.add_argument("--max-languages", type=int, default=loc_counter.max_languages, metavar="N", help=f"Count at most N languages and file types unknown to languages.py apart, any further ones under {loc_counter.other_key} (default: {loc_counter.max_languages})")
+    parser.add_argument("--eta", action="store_true", help="Walk the tree first to total its size, so progress lines also estimate the time left")
+    parser.add_argument("--top-subtrees", type=int, default=10, metavar="N", help="List the N directories and archives with the most lines in the report (default: 10, 0 to disable)")
+    parser.add_argument("--tree", action="store_true", help="Also write the lines of every directory and archive subtree to codebase_tree.txt")
+    parser.add_argument("--analyze", nargs="+", choices=list(file_analyzers.analyzer_types), default=[], help="Run more per-file analyses in the same pass; terms also writes the proprietary term report of proprietary_term_search.py")
+
+    args = parser.parse_args()
+    scan_log.setup_logging(args.log_level, args.quiet)
+    if args.dedup and args.cache is not None:
+        parser.error("--dedup cannot be combined with --cache")
+    if args.analyze and args.cache is not None:
+        parser.error("--analyze cannot be combined with --cache")
+    if args.stream and args.scratch_dir is not None:
+        parser.error("--stream cannot be combined with --scratch-dir")
+
+    search_dir = args.search_directory
+    fast_mode = args.fast
+    # Only kept when a report lists subtrees, as it grows with the number of directories
+    stats = loc_counter.new_stats(args.max_languages, args.tree or args.top_subtrees > 0)
+    if args.dedup:
+        unique_stats = loc_counter.new_stats(args.max_languages, tree=False)
+    analyzers = [file_analyzers.analyzer_types[name]() for name in dict.fromkeys(args.analyze)]
+
+    cache_path = args.cache or os.path.join(search_dir, scan_cache.cache_file_name)
+    outputs = loc_counter.scan_outputs(search_dir, args.jsonl, args.summary_csv, *scan_cache.cache_files(cache_path))
 
     try:
-        archive_types = extract_all_archives(search_dir)
-        process_files_in_directory(search_dir)
-        create_report(os.path.join(search_dir, "codebase_report.txt"), archive_types)
+        if args.jsonl:
+            records_file = open(args.jsonl, 'w')
+        if args.cache is not None:
+            cache = scan_cache.open_cache(cache_path, args.verify_hash)
+        if args.stream:
+            archive_types = Counter()
+        elif args.scratch_dir is None:
+            archive_types = archive_extractor.extract_all_archives(search_dir, args.extract_workers)
+        if not args.quiet:
+            # Archives are still compressed when the scan starts with --scratch-dir, so no time left is estimated
+            progress = scan_log.new_progress(loc_counter.directory_size(search_dir) if args.eta and args.scratch_dir is None else None)
+        if args.scratch_dir is not None:
+            # Archives are extracted by a pool while this process counts the loose files and the
+            # contents of the archives extracted so far; those are counted on the spot, so the
+            # batch sizes do not matter
+            with ProcessPoolExecutor(args.extract_workers) as extract_pool:
+                pipeline = archive_extractor.ExtractionPipeline(extract_pool, args.extract_workers, args.scratch_dir, args.scratch_limit, count_extracted_files, None, search_dir, 4 * 1024 * 1024, 512)
+                try:
+                    process_files_in_directory(search_dir, pipeline=pipeline, outputs=outputs)
+                    pipeline.finish()
+                finally:
+                    pipeline.close()
+            archive_types = pipeline.archive_types
+        else:
+            process_files_in_directory(search_dir, archive_types if args.stream else None, outputs=outputs)
+        if progress is not None:
+            scan_log.log_progress(progress)
+        loc_counter.create_report(os.path.join(search_dir, loc_counter.report_file_name), archive_types, stats, unique_stats, args.top_subtrees)
+        if args.tree:
+            loc_counter.create_tree_report(os.path.join(search_dir, loc_counter.tree_report_file_name), stats, search_dir)
+        if args.summary_csv:
+            loc_counter.create_summary_csv(args.summary_csv, stats)
+        for analyzer in analyzers:
+            analyzer.write_report(stats)
+        if records_file is not None:
+            records_file.close()
+        if cache is not None:
+            logger.info(f"Cache: {cache['hits']} hits, {cache['misses']} misses")
+            scan_cache.close_cache(cache)
+        scan_log.log_peak_rss(children=args.scratch_dir is not None)
     except Exception as e:
-        print(f"An error occurred: {e}", file=sys.stderr)
+        logger.error(f"An error occurred: {e}")
         sys.exit(1)
@@ -1,163 +1,293 @@
 import os
-import tarfile
-import zipfile
-import tempfile
-import shutil
-from multiprocessing import Pool, Manager, cpu_count
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool, Queue, cpu_count
 import argparse
 import sys
+import tempfile
 
-# Dictionary of folder names
-folder_names = {
-    "git": [".git"],
-    # "config": [".config"],
-    # "cache": [".cache"],
-    # Add more folder names as needed
-}
+import archive_extractor
+import loc_counter
+import content_sniffer
+import scan_cache
+import scan_log
+from scan_log import logger
+from loc_counter import archive_extensions, folder_names_list
 
-folder_names_list = [name for names in folder_names.values() for name in names]
+# Function to walk the search directory and yield batches of (file to read, path to report)
+# entries, closing a batch once it reaches batch_bytes of content or batch_files files so every task
+# carries a similar load; archives found on the way are passed to on_archive when it is given, and
+# the files of outputs (see loc_counter.scan_outputs()) are skipped
+def iter_file_batches(search_dir, batch_bytes, batch_files, on_archive=None, outputs=None):
+    batch = []
+    batch_size = 0
+    for root, dirs, files in os.walk(search_dir):
+        # Filter out directories you want to ignore
+        dirs[:] = [d for d in dirs if d not in folder_names_list]
+        for file in files:
+            if on_archive is not None and file.endswith(archive_extensions):
+                on_archive(os.path.join(root, file))
+                continue
+            if not loc_counter.is_countable(file) or loc_counter.is_scan_output(root, file, outputs):
+                continue  # Skip archive and git files, and the reports of this scan and earlier ones
+            file_path = os.path.join(root, file)
+            try:
+                batch_size += os.path.getsize(file_path)
+            except OSError:
+                pass  # unreadable files are reported by the worker
+            batch.append((file_path, file_path))
+            if batch_size >= batch_bytes or len(batch) >= batch_files:
+                yield batch
+                batch = []
+                batch_size = 0
+    if batch:
+        yield batch
 
-# Function to extract archives using tar, gz, or zip format
-def extract(archive, extract_to, archive_types, lock):
+# Counts of every blob a worker process has classified, kept across batches when deduplicating
+blob_counts = {}
+
+# Function to process a batch of (file to read, path to report) entries: each file is read and
+# sniffed in turn, then counted like the entries of the asyncio front end. Returns the same as
+# process_data_batch()
+def process_file_batch(entries, fast=False, dedup=False, records=False):
+    read_entries = (read_file(file_path, report_path) for file_path, report_path in entries)
+    return process_data_batch((entry for entry in read_entries if entry is not None), fast, dedup, records)
+
+# Function to count a batch of (file, size, contents, bytes read) entries (see read_file()), contents
+# being None for a binary, and return its statistics; when deduplicating, also returns a (blob key,
+# file, counts) record for every blob new to this worker so the parent can build the unique
+# statistics across all workers, with records the JSON Lines record of every file, and the number of
+# bytes in the batch for the progress line. Log records are sent once per batch
+def process_data_batch(entries, fast=False, dedup=False, records=False):
+    # Uncapped: a batch holds few files, and the cap is applied when it is merged into the totals
+    batch_stats = loc_counter.new_stats(None)
+    unique_records = []
+    file_records = []
+    batch_bytes = 0
+    for file_path, size, data, bytes_read in entries:
+        batch_bytes += size
+        if data is None:
+            loc_counter.add_skipped_binary(batch_stats, size - bytes_read)
+            if records:
+                file_records.append(loc_counter.format_record(file_path, 'binary', size=size))
+            logger.debug("Skipped binary file %s", file_path)
+            continue
+        logger.debug("Processing file: %s with PID: %s", file_path, os.getpid())
+        try:
+            if dedup:
+                counts, key, first_seen = loc_counter.count_deduplicated(file_path, data, blob_counts, fast)
+                if first_seen:
+                    unique_records.append((key, file_path, counts))
+            else:
+                counts = loc_counter.count_data(file_path, data, fast)
+            loc_counter.add_file_counts(batch_stats, file_path, counts)
+            if records:
+                # Duplicates are only known across workers, so every counted file is reported as counted
+                file_records.append(loc_counter.format_record(file_path, 'counted', counts))
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {e}")
+    scan_log.flush_worker_logging()
+    return batch_stats, unique_records, file_records, batch_bytes
+
+# Function to list a directory in an I/O thread; returns the subdirectories to walk and the files
+# to count, skipping the same folders and files as iter_file_batches()
+def scan_directory(directory, outputs=None):
+    subdirectories = []
+    files = []
     try:
-        if archive.endswith(('.tar', '.tar.gz', '.tar.bz2', '.tgz')):
-            with tarfile.open(archive, 'r:*') as tar:
-                tar.extractall(path=extract_to)
-        elif archive.endswith('.zip'):
-            with zipfile.ZipFile(archive, 'r') as zip_ref:
-                zip_ref.extractall(extract_to)
-        else:
-            print(f"Error: Unknown archive format for file '{archive}'", file=sys.stderr)
-            exit(1)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # Like os.walk, symbolic links to directories are not followed
+                    if entry.name not in folder_names_list and not entry.is_symlink():
+                        subdirectories.append(entry.path)
+                elif loc_counter.is_countable(entry.name) and not loc_counter.is_scan_output(directory, entry.name, outputs):
+                    files.append(entry.path)
+    except OSError as e:
+        logger.error(f"Error listing directory {directory}: {e}")
+    return subdirectories, files
 
-        archive_type = os.path.splitext(archive)[-1].lower()
-        with lock:
-            archive_types[archive_type] = archive_types.get(archive_type, 0) + 1
-    except Exception as e:
-        print(f"Error: Failed to extract archive '{archive}': {e}", file=sys.stderr)
-        exit(1)
-
-# Function to determine the language of a file based on its extension or return the file name if no extension exists
-def get_lang(file):
-    # Check if the file has an extension
-    extension = os.path.splitext(file)[1].lower()
-    if extension:
-        return extension
-    else:
-        return os.path.basename(file).lower()
-
-# Function to count lines of code and update statistics for each language
-def count_loc(loc, file, lang_stats, tot_loc, file_type_counts, lock):
-    with lock:
-        tot_loc.value += loc
-        lang = get_lang(file)
-        lang_stats[lang] = lang_stats.get(lang, 0) + loc
-        file_type_counts[lang] = file_type_counts.get(lang, 0) + 1
-
-# Function to find archives in the search directory
-def find_archives(search_dir):
-    archives = []
-    for root, _, files in os.walk(search_dir):
-        for file in files:
-            if file.endswith(('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz')):
-                archives.append(os.path.join(root, file))
-    return archives
-
-# Function to recursively extract all archives
-def extract_all_archives(search_dir, archive_types, lock):
-    while True:
-        archives = find_archives(search_dir)
-        if not archives:
-            break
-
-        for archive in archives:
-            print(f"Found archive: {archive}")
-            temp_dir = tempfile.mkdtemp()
+# Function to read a file, in an I/O thread or a worker; returns the (path to report, size, contents,
+# bytes read) entry counted by process_data_batch(), or None when the file cannot be read. Binaries
+# are recognised from the extension or the first few KB and not read any further
+def read_file(file_path, report_path=None):
+    report_path = report_path or file_path
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            binary, head = content_sniffer.sniff_stream(report_path, f)
+            if binary:
+                return report_path, size, None, len(head)
+            return report_path, size, head + f.read(), size
+    except OSError as e:
+        logger.error(f"Error processing file {report_path}: {e}")
+        return None
+
+# Function to walk the search directory and read its files with an asyncio front end, for trees on
+# network filesystems where every stat and open waits on a round trip. io_threads threads list
+# directories and read files, so that many requests are in flight at once, and batches of contents
+# are counted by the processes of cpu_pool, at most max_pending batches at a time so reading stops
+# while the counters catch up. handle_batch() is called with the result of every batch, and the files
+# of outputs are skipped as by iter_file_batches()
+async def scan_with_async_io(search_dir, io_threads, cpu_pool, count_batch, batch_bytes, batch_files, max_pending, handle_batch, outputs=None):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    queue.put_nowait((True, search_dir))
+    cpu_slots = asyncio.Semaphore(max_pending)
+    cpu_tasks = set()
+    batch = []
+    batch_size = 0
+
+    async def count(entries):
+        try:
+            handle_batch(await loop.run_in_executor(cpu_pool, count_batch, entries))
+        finally:
+            cpu_slots.release()
+
+    async def submit():
+        nonlocal batch, batch_size
+        entries, batch, batch_size = batch, [], 0
+        await cpu_slots.acquire()
+        task = asyncio.create_task(count(entries))
+        cpu_tasks.add(task)
+
+    async def io_worker(io_pool):
+        nonlocal batch_size
+        while True:
+            is_directory, path = await queue.get()
             try:
-                extract(archive, temp_dir, archive_types, lock)
-                for item in os.listdir(temp_dir):
-                    s = os.path.join(temp_dir, item)
-                    d = os.path.join(search_dir, item)
-                    if os.path.isdir(s):
-                        if os.path.exists(d):
-                            shutil.rmtree(d)
-                        shutil.move(s, d)
-                    else:
-                        shutil.move(s, d)
+                if is_directory:
+                    subdirectories, files = await loop.run_in_executor(io_pool, scan_directory, path, outputs)
+                    for item in subdirectories:
+                        queue.put_nowait((True, item))
+                    for item in files:
+                        queue.put_nowait((False, item))
+                    continue
+                entry = await loop.run_in_executor(io_pool, read_file, path)
+                if entry is not None:
+                    batch.append(entry)
+                    batch_size += entry[1]
+                    if batch_size >= batch_bytes or len(batch) >= batch_files:
+                        await submit()
             finally:
-                shutil.rmtree(temp_dir)
+                queue.task_done()
 
-            os.remove(archive)
+    with ThreadPoolExecutor(io_threads) as io_pool:
+        io_workers = [asyncio.create_task(io_worker(io_pool)) for _ in range(io_threads)]
+        await queue.join()
+        for io_task in io_workers:
+            io_task.cancel()
+    if batch:
+        await submit()
+    await asyncio.gather(*cpu_tasks)
 
-# Function to process source code files in a single extracted directory
-def process_files_in_directory(directory, lang_stats, tot_loc, file_type_counts, total_files_found, lock):
-    print(f"Processing directory: {directory} with PID: {os.getpid()}")
-    for root, dirs, files in os.walk(directory):
-        # Filter out directories you want to ignore
-        dirs[:] = [d for d in dirs if d not in folder_names_list]
-        for file in files:
-            if file.endswith(('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz')):
-                continue  # Skip archive files
-            file_path = os.path.join(root, file)
-            print(f"Processing file: {file_path} with PID: {os.getpid()}")
-            try:
-                with open(file_path, 'r', errors='ignore') as f:
-                    loc = sum(1 for _ in f)
-                count_loc(loc, file_path, lang_stats, tot_loc, file_type_counts, lock)
-                with lock:
-                    total_files_found.value += 1
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}", file=sys.stderr)
-
-# Function to generate the codebase report
-def create_report(report_path, archive_types, total_files_found, tot_loc, file_type_counts, lang_stats):
-    with open(report_path, 'w') as report_file:
-        report_file.write(f"Total archives found: {sum(archive_types.values())}\n")
-        report_file.write("Archives by type:\n")
-        for ext, count in archive_types.items():
-            report_file.write(f"{ext}: {count}\n")
-
-        report_file.write(f"\nTotal files found: {total_files_found.value}\n")
-        report_file.write(f"Total lines of code found: {tot_loc.value}\n\n")
-
-        report_file.write("Files of each type found:\n")
-        for ext in sorted(file_type_counts.keys()):
-            report_file.write(f"{ext}: {file_type_counts[ext]}\n")
-
-        report_file.write("\nLanguage statistics:\n")
-        for lang in sorted(lang_stats.keys()):
-            count = lang_stats[lang]
-            percentage = (count / tot_loc.value) * 100 if tot_loc.value > 0 else 0
-            report_file.write(f"{lang}: {count} lines ({percentage:.2f}%)\n")
+# Function to merge the result of a batch into the totals, writing its records and advancing progress
+def collect_batch(result, totals, unique_stats, seen_blobs, records_file, progress):
+    batch_stats, unique_records, file_records, batch_bytes = result
+    loc_counter.merge_stats(totals, batch_stats)
+    scan_log.advance_progress(progress, batch_stats['total_files_found'] + batch_stats['binary_files'], batch_bytes)
+    # Records are written as batches come back, so they are never all held in memory
+    if records_file is not None:
+        records_file.writelines(file_records)
+    # Workers only know their own blobs; the first copy seen across all workers counts
+    for key, file_path, counts in unique_records:
+        if key not in seen_blobs:
+            seen_blobs.add(key)
+            loc_counter.add_file_counts(unique_stats, file_path, counts)
 
 # Main script execution
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze codebase and generate statistics")
     parser.add_argument("search_directory", help="Directory to search for code files and archives")
     parser.add_argument("--cpus", type=int, default=cpu_count() - 1, help="Number of CPUs to use (default: one less than the total number of CPUs)")
+    parser.add_argument("--batch-bytes", type=int, default=4 * 1024 * 1024, help="Close a work batch once its files total this many bytes (default: 4 MiB)")
+    parser.add_argument("--batch-files", type=int, default=512, help="Maximum number of files in a work batch (default: 512)")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of archives extracted at once; each is extracted in place, next to where it was found (default: 1)")
+    parser.add_argument("--scratch-dir", nargs="?", const=tempfile.gettempdir(), metavar="DIR", help="Extract archives under DIR (default: the system temporary directory) by a pool of --extract-workers processes while the files already extracted are counted, deleting them once counted; the search directory is left untouched")
+    parser.add_argument("--scratch-limit", type=int, default=archive_extractor.scratch_limit, metavar="BYTES", help="Stop starting extractions while the scratch directory holds this many bytes (default: 1 GiB)")
+    parser.add_argument("--io-threads", type=int, default=0, help="Walk and read the tree from an asyncio front end with this many I/O threads, the --cpus workers only counting; for network filesystems (default: 0, workers read their own files)")
+    parser.add_argument("--fast", action="store_true", help="Classify lines on raw bytes in bulk instead of decoding files line by line")
+    parser.add_argument("--dedup", action="store_true", help="Count files with identical contents once and also report unique lines of code per extension")
+    parser.add_argument("--jsonl", metavar="PATH", help="Stream one JSON record per file (path, language, status and line counts) to PATH while scanning")
+    parser.add_argument("--summary-csv", metavar="PATH", help="Also write the per-language statistics to PATH as CSV")
+    parser.add_argument("--log-level", choices=scan_log.log_levels, default="INFO", help="Logging level; DEBUG logs every file (default: INFO)")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings and errors, without progress lines")
+    parser.add_argument("--max-languages", type=int, default=loc_counter.max_languages, metavar="N", help=f"Count at most N languages and file types unknown to languages.py apart, any further ones under {loc_counter.other_key} (default: {loc_counter.max_languages})")
+    parser.add_argument("--eta", action="store_true", help="Walk the tree first to total its size, so progress lines also estimate the time left")
+    parser.add_argument("--top-subtrees", type=int, default=10, metavar="N", help="List the N directories and archives with the most lines in the report (default: 10, 0 to disable)")
+    parser.add_argument("--tree", action="store_true", help="Also write the lines of every directory and archive subtree to codebase_tree.txt")
 
     args = parser.parse_args()
+    scan_log.setup_logging(args.log_level, args.quiet)
+    if args.scratch_dir is not None and args.io_threads:
+        parser.error("--scratch-dir cannot be combined with --io-threads")
+    if args.eta and args.io_threads:
+        parser.error("--eta cannot be combined with --io-threads: the walk it adds is the latency-bound pass the front end avoids")
 
     search_dir = args.search_directory
     num_cpus = args.cpus
+    outputs = loc_counter.scan_outputs(search_dir, args.jsonl, args.summary_csv, *scan_cache.cache_files(os.path.join(search_dir, scan_cache.cache_file_name)))
 
     try:
-        manager = Manager()
-        lang_stats = manager.dict()
-        tot_loc = manager.Value('i', 0)
-        file_type_counts = manager.dict()
-        total_files_found = manager.Value('i', 0)
-        archive_types = manager.dict()
-        lock = manager.Lock()
+        if args.scratch_dir is None:
+            archive_types = archive_extractor.extract_all_archives(search_dir, args.extract_workers)
 
-        extract_all_archives(search_dir, archive_types, lock)
-
-        subdirs = [os.path.join(search_dir, d) for d in os.listdir(search_dir) if os.path.isdir(os.path.join(search_dir, d))]
-
-        with Pool(processes=num_cpus) as pool:
-            pool.starmap(process_files_in_directory, [(subdir, lang_stats, tot_loc, file_type_counts, total_files_found, lock) for subdir in subdirs])
+        # Only kept when a report lists subtrees, as it grows with the number of directories
+        totals = loc_counter.new_stats(args.max_languages, args.tree or args.top_subtrees > 0)
+        unique_stats = loc_counter.new_stats(args.max_languages, tree=False) if args.dedup else None
+        seen_blobs = set()
+        records_file = open(args.jsonl, 'w') if args.jsonl else None
+        # Archives are still compressed when the scan starts with --scratch-dir, so no time left is estimated
+        progress = None if args.quiet else scan_log.new_progress(loc_counter.directory_size(search_dir) if args.eta and args.scratch_dir is None else None)
+        handle_batch = partial(collect_batch, totals=totals, unique_stats=unique_stats, seen_blobs=seen_blobs, records_file=records_file, progress=progress)
+        # Workers log through a queue drained by a single writer thread in this process
+        log_queue = Queue()
+        listener = scan_log.start_worker_listener(log_queue)
+        if args.io_threads:
+            count_batch = partial(process_data_batch, fast=args.fast, dedup=args.dedup, records=records_file is not None)
+            # Leaving the block waits for the workers to exit on their own
+            with ProcessPoolExecutor(num_cpus, initializer=scan_log.setup_worker_logging, initargs=(log_queue, logger.level)) as cpu_pool:
+                asyncio.run(scan_with_async_io(search_dir, args.io_threads, cpu_pool, count_batch, args.batch_bytes, args.batch_files, 2 * num_cpus, handle_batch, outputs))
+        elif args.scratch_dir is not None:
+            # Archives are extracted by one pool while the other counts the loose files and the
+            # contents of the archives extracted so far
+            count_batch = partial(process_file_batch, fast=args.fast, dedup=args.dedup, records=records_file is not None)
+            with ProcessPoolExecutor(num_cpus, initializer=scan_log.setup_worker_logging, initargs=(log_queue, logger.level)) as cpu_pool, \
+                    ProcessPoolExecutor(args.extract_workers) as extract_pool:
+                pipeline = archive_extractor.ExtractionPipeline(extract_pool, args.extract_workers, args.scratch_dir, args.scratch_limit, partial(cpu_pool.submit, count_batch), handle_batch, search_dir, args.batch_bytes, args.batch_files)
+                try:
+                    for batch in iter_file_batches(search_dir, args.batch_bytes, args.batch_files, pipeline.add_archive, outputs):
+                        pipeline.add_files(batch)
+                        pipeline.poll()
+                    pipeline.finish()
+                finally:
+                    pipeline.close()
+            archive_types = pipeline.archive_types
+        else:
+            # The walk is consumed lazily by the pool's task feeder, so batches are dispatched while
+            # the tree is still being walked. Workers count into local statistics and return them;
+            # the parent merges (map-reduce)
+            batches = iter_file_batches(search_dir, args.batch_bytes, args.batch_files, outputs=outputs)
+            with Pool(processes=num_cpus, initializer=scan_log.setup_worker_logging, initargs=(log_queue, logger.level)) as pool:
+                for result in pool.imap_unordered(partial(process_file_batch, fast=args.fast, dedup=args.dedup, records=records_file is not None), batches):
+                    handle_batch(result)
+                # Let the workers exit on their own: a worker terminated while sending its last log
+                # records would leave the queue locked
+                pool.close()
+                pool.join()
+        listener.stop()
+        if progress is not None:
+            scan_log.log_progress(progress)
 
-        create_report(os.path.join(search_dir, "codebase_report.txt"), archive_types, total_files_found, tot_loc, file_type_counts, lang_stats)
+        loc_counter.create_report(os.path.join(search_dir, loc_counter.report_file_name), archive_types, totals, unique_stats, args.top_subtrees)
+        if args.tree:
+            loc_counter.create_tree_report(os.path.join(search_dir, loc_counter.tree_report_file_name), totals, search_dir)
+        if args.summary_csv:
+            loc_counter.create_summary_csv(args.summary_csv, totals)
+        if records_file is not None:
+            records_file.close()
+        scan_log.log_peak_rss(children=True)
     except Exception as e:
-        print(f"An error occurred: {e}", file=sys.stderr)
+        logger.error(f"An error occurred: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+
+import languages
+
+# Quick binary detection shared by the scanners. Conclusive extensions decide on their own; any other
+# file is judged from its first few KB, so a binary is skipped without being read or decoded whole.
+
+# Number of leading bytes inspected
+sniff_bytes = 8 * 1024
+
+# Share of suspicious bytes above which a sample that is not UTF-8 is treated as binary
+max_binary_ratio = 0.3
+
+# Extensions treated as text without looking at the contents: those of the languages in the
+# registry but their binary data formats (such as R's .rds), and plain text and data formats
+text_extensions = (frozenset(languages.extension_languages) - languages.data_extensions) | frozenset({
+    '.json', '.txt', '.md', '.rst', '.csv',
+})
+
+# Extensions treated as binary without looking at the contents
+binary_extensions = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.ico', '.tif', '.tiff', '.webp', '.pdf', '.mp3', '.mp4',
+    '.wav', '.avi', '.mov', '.ogg', '.woff', '.woff2', '.ttf', '.otf', '.eot', '.exe', '.dll', '.so',
+    '.dylib', '.o', '.a', '.lib', '.obj', '.class', '.jar', '.pyc', '.pyo', '.whl', '.gz', '.bz2', '.xz',
+    '.7z', '.rar', '.sqlite', '.db',
+})
+
+# Bytes that text does not contain: control characters other than whitespace, backspace and escape,
+# and, in samples that are not valid UTF-8, every byte outside ASCII
+control_bytes = bytes(byte for byte in range(32) if byte not in b'\t\n\r\x0b\x0c\x08\x1b') + b'\x7f'
+non_ascii_bytes = bytes(range(128, 256))
+
+
+# Function to decide from the extension alone; returns None when the contents have to be sniffed
+def binary_by_extension(name):
+    extension = os.path.splitext(name)[1].lower()
+    if extension in binary_extensions:
+        return True
+    if extension in text_extensions:
+        return False
+    return None
+
+
+# Function to check whether a sample of the first bytes of a file looks binary
+def is_binary_sample(sample):
+    if not sample:
+        return False
+    if b'\0' in sample:
+        return True
+    try:
+        sample.decode('utf-8')
+        suspicious = control_bytes
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a multi-byte character
+        if e.reason == 'unexpected end of data' and e.start >= len(sample) - 3:
+            suspicious = control_bytes
+        else:
+            suspicious = control_bytes + non_ascii_bytes
+    return len(sample) - len(sample.translate(None, suspicious)) > max_binary_ratio * len(sample)
+
+
+# Function to sniff a binary stream; returns (binary, head) where head holds the bytes consumed
+# from the stream (empty when the extension decided) and comes before the rest of the contents
+def sniff_stream(name, stream):
+    binary = binary_by_extension(name)
+    if binary is not None:
+        return binary, b''
+    head = stream.read(sniff_bytes)
+    return is_binary_sample(head), head
+
+
+# Function to sniff a file on disk; returns (binary, number of bytes read)
+def sniff_file(path):
+    binary = binary_by_extension(path)
+    if binary is not None:
+        return binary, 0
+    with open(path, 'rb') as f:
+        head = f.read(sniff_bytes)
+    return is_binary_sample(head), len(head)
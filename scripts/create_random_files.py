@@ -1,11 +1,20 @@
+import io
 import os
+import time
 import random
 import string
-import sys
+import argparse
 import shutil
+import tarfile
+import zipfile
 from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
 
-# Mapping of programming languages to their possible file extensions
+import languages
+
+# Mapping of programming languages to the file extensions the corpus is drawn from; their comment
+# syntax comes from the shared registry in languages.py
 file_extensions = {
     "javascript": [".cjs", ".js", ".mjs"],
     "typescript": [".ts", ".tsx"],
@@ -28,84 +37,74 @@ folder_names = {
 
 folder_names_list = [name.replace(".","") for names in folder_names.values() for name in names]
 
-# Comment symbols for each file extension
-comment_symbols = {
-    '.py': ('#', ('"""', '"""')),
-    '.cjs': ('//', ('/*', '*/')),
-    '.js': ('//', ('/*', '*/')),
-    '.mjs': ('//', ('/*', '*/')),
-    '.ts': ('//', ('/*', '*/')),
-    '.tsx': ('//', ('/*', '*/')),
-    '.c': ('//', ('/*', '*/')),
-    '.h': ('//', ('/*', '*/')),
-    '.cpp': ('//', ('/*', '*/')),
-    '.cc': ('//', ('/*', '*/')),
-    '.cxx': ('//', ('/*', '*/')),
-    '.hpp': ('//', ('/*', '*/')),
-    '.hxx': ('//', ('/*', '*/')),
-    '.h++': ('//', ('/*', '*/')),
-    '.inl': ('//', ('/*', '*/')),
-    '.ipp': ('//', ('/*', '*/')),
-    '.tcc': ('//', ('/*', '*/')),
-    '.tpp': ('//', ('/*', '*/')),
-    '.java': ('//', ('/*', '*/')),
-    '.r': ('#', ('/*', '*/')),
-    '.rdata': ('#', ('/*', '*/')),
-    '.rds': ('#', ('/*', '*/'))
-}
+# Characters of random strings, and a table mapping every byte onto them so that random bytes are
+# turned into text in bulk (the first 8 characters come up 5/256 instead of 4/256 of the time)
+alphabet = string.ascii_letters + string.digits
+alphabet_table = ((alphabet * 5)[:256]).encode('ascii')
 
 # Function to generate a random string
-def random_string(length):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+def random_string(length, rng=random):
+    return rng.randbytes(length).translate(alphabet_table).decode('ascii')
 
 # Function to create a random subdirectory path with a given maximum depth
-def create_random_subdirectory_path(base_path, max_depth):
-    depth = random.randint(1, max_depth)
+# (directories are only created on disk with make_dirs)
+def create_random_subdirectory_path(base_path, max_depth, rng=random, make_dirs=True):
+    depth = rng.randint(1, max_depth)
     subdir_path = base_path
     subdir_paths = []
     for _ in range(depth):
-        subdir_name = str(random.randint(1000, 9999))
+        subdir_name = str(rng.randint(1000, 9999))
         subdir_path = os.path.join(subdir_path, subdir_name)
         subdir_paths.append(subdir_path)
-        os.makedirs(subdir_path, exist_ok=True)
+        if make_dirs:
+            os.makedirs(subdir_path, exist_ok=True)
 
         # 5% chance to randomly choose and create additional subfolders from folder_names
-        if random.random() < 0.10:
+        if rng.random() < 0.10:
             for names in folder_names.values():
-                random_folder = random.choice(names)
+                random_folder = rng.choice(names)
                 random_folder_path = os.path.join(subdir_path, random_folder)
                 subdir_paths.append(random_folder_path)
-                os.makedirs(random_folder_path, exist_ok=True)
+                if make_dirs:
+                    os.makedirs(random_folder_path, exist_ok=True)
 
     return subdir_paths
 
-# Function to create random code lines with comments
-def create_random_code_lines(extension):
-    num_lines = random.randint(5, 20)  # Random number of lines of code
-    code_lines = []
+# Function to create random code lines with comments. The layout of the lines is drawn first and
+# the text of all of them comes from a single random buffer
+def create_random_code_lines(extension, rng=random):
+    num_lines = rng.randint(5, 20)  # Random number of lines of code
+    layout = []  # (prefix, length of the random text) of every line
 
-    single_line_comment_symbol, multi_line_comment_symbols = comment_symbols.get(extension, ('#', ('"""', '"""')))
+    language = languages.extension_language(extension)
+    single_line_comment_symbol = language['line_comments'][0]
+    multi_line_comment_symbols = language['block_comments'][0]
     comment_count = 0
     code_count = 0
 
     for _ in range(num_lines):
-        if random.random() < 0.1 and extension:  # 10% chance to start a multi-line comment
-            code_lines.append(multi_line_comment_symbols[0])
-            filler_lines = random.randint(1, 5)
+        if rng.random() < 0.1 and extension:  # 10% chance to start a multi-line comment
+            layout.append((multi_line_comment_symbols[0], 0))
+            filler_lines = rng.randint(1, 5)
             for _ in range(filler_lines):
-                code_lines.append(random_string(random.randint(10, 80)))
+                layout.append(('', rng.randint(10, 80)))
                 comment_count += 1
-            code_lines.append(multi_line_comment_symbols[1])
+            layout.append((multi_line_comment_symbols[1], 0))
             comment_count += 2  # Start and end symbols
-        elif random.random() < 0.2 and extension:  # 20% chance to add a single-line comment
-            line_length = random.randint(10, 80)
-            code_lines.append(single_line_comment_symbol + ' ' + random_string(line_length))
+        elif rng.random() < 0.2 and extension:  # 20% chance to add a single-line comment
+            layout.append((single_line_comment_symbol + ' ', rng.randint(10, 80)))
             comment_count += 1
         else:
-            line_length = random.randint(10, 80)
-            code_lines.append(random_string(line_length))
+            layout.append(('', rng.randint(10, 80)))
             code_count += 1
 
+    text = random_string(sum(length for _, length in layout), rng)
+    code_lines = []
+    position = 0
+    for prefix, length in layout:
+        code_lines.append(prefix + text[position:position + length])
+        position += length
+
     total_lines = comment_count + code_count
     return '\n'.join(code_lines), code_count, comment_count, total_lines
 
@@ -124,52 +123,142 @@ def archive_directory(directory, archive_format):
     # Clean up the directory after archiving
     shutil.rmtree(directory)
 
-# Function to create files in a directory with specified parameters
-def create_files_in_directory(parent_directory, num_subdirs, num_files, max_depth):
-    os.makedirs(parent_directory, exist_ok=True)
+# File extension of each archive format
+archive_suffixes = {'zip': '.zip', 'tar': '.tar', 'gztar': '.tar.gz', 'bztar': '.tar.bz2'}
 
+# Function to build an archive in memory with the same layout as archive_directory(): the directory
+# itself and, inside it, the given (file name, contents) members
+def build_archive(directory_name, members, archive_format):
+    buffer = io.BytesIO()
+    if archive_format == 'zip':
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr(directory_name + '/', b'')
+            for name, data in members:
+                zip_file.writestr(f"{directory_name}/{name}", data)
+    else:
+        mode = {'tar': 'w', 'gztar': 'w:gz', 'bztar': 'w:bz2'}[archive_format]
+        mtime = time.time()
+        with tarfile.open(fileobj=buffer, mode=mode) as tar:
+            info = tarfile.TarInfo(directory_name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = mtime
+            tar.addfile(info)
+            for name, data in members:
+                info = tarfile.TarInfo(f"{directory_name}/{name}")
+                info.size = len(data)
+                info.mode = 0o644
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+# Function to fill the directories of one top-level subtree with files and archive them bottom-up.
+# Subtrees share no directories, so they are generated independently, each from its own seed. With
+# in_memory, files are kept in memory and written straight into their archive, nested archives are
+# built as members of their parent's, and only the top-level archive is written to disk; the same
+# seed generates the same contents either way
+def create_subtree(subdir_paths, num_files, seed, in_memory=False):
+    rng = random.Random(seed)
+    members = defaultdict(list)  # (file name, contents) of every directory, with in_memory
     total_files_created = 0
-    subdirs_created = set()
     file_type_counts = defaultdict(int)
     lang_stats = defaultdict(lambda: {'total': 0, 'code': 0, 'comments': 0})
     tot_loc = 0
 
-    for _ in range(num_subdirs):
-        subdir_paths = create_random_subdirectory_path(parent_directory, max_depth)
-        subdirs_created.update(subdir_paths)
-
-        for subdir_path in subdir_paths:
-            if subdir_path.split(".")[-1] in folder_names_list:
-                continue
-            for _ in range(num_files):
-                # Choose a random language and extension
-                language = random.choice(list(file_extensions.keys()))
-                extension = random.choice(file_extensions[language]).lower()  # Ensure extension is in lowercase
-
-                # Create a random filename
-                file_name = random_string(random.randint(5, 10)) + extension
-                file_path = os.path.join(subdir_path, file_name)
-
-                # Write random code lines to the file
-                code, code_count, comment_count, total_lines = create_random_code_lines(extension)
+    for subdir_path in subdir_paths:
+        if subdir_path.split(".")[-1] in folder_names_list:
+            continue
+        for _ in range(num_files):
+            # Choose a random language and extension
+            language = rng.choice(list(file_extensions.keys()))
+            extension = rng.choice(file_extensions[language]).lower()  # Ensure extension is in lowercase
+
+            # Create a random filename
+            file_name = random_string(rng.randint(5, 10), rng) + extension
+            file_path = os.path.join(subdir_path, file_name)
+
+            # Write random code lines to the file
+            code, code_count, comment_count, total_lines = create_random_code_lines(extension, rng)
+            if in_memory:
+                members[subdir_path].append((file_name, code.encode()))
+            else:
                 with open(file_path, 'w') as file:
                     file.write(code)
 
-                file_type_counts[extension] += 1
-                lang_stats[extension]['total'] += total_lines
-                lang_stats[extension]['comments'] += comment_count
-                lang_stats[extension]['code'] += code_count
-                tot_loc += total_lines
-                total_files_created += 1
+            file_type_counts[extension] += 1
+            lang_stats[extension]['total'] += total_lines
+            lang_stats[extension]['comments'] += comment_count
+            lang_stats[extension]['code'] += code_count
+            tot_loc += total_lines
+            total_files_created += 1
 
-                # Debugging output to verify line counts
-                print(f"Generated {total_lines} lines in {file_name} ({code_count} code - {comment_count} comments)")
+            # Debugging output to verify line counts
+            print(f"Generated {total_lines} lines in {file_name} ({code_count} code - {comment_count} comments)")
 
-    # Archive the subdirectories starting from the deepest one
-    sorted_subdirs = sorted(subdirs_created, key=lambda x: x.count(os.sep), reverse=True)
+    # Archive the subdirectories starting from the deepest one, so every archive holds the archives
+    # of its subdirectories
+    sorted_subdirs = sorted(subdir_paths, key=lambda x: (x.count(os.sep), x), reverse=True)
+    subdir_set = set(subdir_paths)
     for subdir_path in sorted_subdirs:
-        archive_format = random.choice(['zip', 'tar', 'gztar', 'bztar'])
-        archive_directory(subdir_path, archive_format)
+        archive_format = rng.choice(['zip', 'tar', 'gztar', 'bztar'])
+        if not in_memory:
+            archive_directory(subdir_path, archive_format)
+            continue
+        archive_name = os.path.basename(subdir_path) + archive_suffixes[archive_format]
+        data = build_archive(os.path.basename(subdir_path), members.pop(subdir_path, []), archive_format)
+        parent_path = os.path.dirname(subdir_path)
+        if parent_path in subdir_set:
+            members[parent_path].append((archive_name, data))
+        else:
+            with open(os.path.join(parent_path, archive_name), 'wb') as archive_file:
+                archive_file.write(data)
+
+    return total_files_created, dict(file_type_counts), dict(lang_stats), tot_loc
+
+# Function to run create_subtree() on a (subdirectory paths, seed) task
+def create_subtree_task(task, num_files, in_memory=False):
+    subdir_paths, seed = task
+    return create_subtree(subdir_paths, num_files, seed, in_memory)
+
+# Function to create files in a directory with specified parameters. The directory layout is drawn
+# first; the top-level subtrees are then filled and archived by a pool of worker processes. The
+# same seed generates the same tree whatever the number of workers
+def create_files_in_directory(parent_directory, num_subdirs, num_files, max_depth, seed=None, workers=1, in_memory=False):
+    os.makedirs(parent_directory, exist_ok=True)
+    rng = random.Random(seed)
+
+    subdirs_created = set()
+    for _ in range(num_subdirs):
+        subdir_paths = create_random_subdirectory_path(parent_directory, max_depth, rng, not in_memory)
+        subdirs_created.update(subdir_paths)
+
+    # Group the directories by the top-level directory they are in
+    subtrees = defaultdict(list)
+    for subdir_path in subdirs_created:
+        top_level = os.path.relpath(subdir_path, parent_directory).split(os.sep)[0]
+        subtrees[top_level].append(subdir_path)
+    base_seed = rng.getrandbits(64)
+    tasks = [(sorted(subtrees[top_level]), f"{base_seed}:{top_level}") for top_level in sorted(subtrees)]
+
+    create = partial(create_subtree_task, num_files=num_files, in_memory=in_memory)
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = pool.map(create, tasks, chunksize=1)
+    else:
+        results = map(create, tasks)
+
+    total_files_created = 0
+    file_type_counts = defaultdict(int)
+    lang_stats = defaultdict(lambda: {'total': 0, 'code': 0, 'comments': 0})
+    tot_loc = 0
+    for subtree_files, subtree_file_type_counts, subtree_lang_stats, subtree_loc in results:
+        total_files_created += subtree_files
+        for extension, count in subtree_file_type_counts.items():
+            file_type_counts[extension] += count
+        for extension, counts in subtree_lang_stats.items():
+            for key, count in counts.items():
+                lang_stats[extension][key] += count
+        tot_loc += subtree_loc
 
     return len(subdirs_created), total_files_created, file_type_counts, lang_stats, tot_loc
 
@@ -200,18 +289,24 @@ def write_statistics_to_file(statistics, output_file_path, parent_directory, num
             report_file.write(f"{ext}: {count} lines [{code_count} code - {comment_count} comments] ({percentage:.2f}%)\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: python script.py <parent_directory> <num_subdirs> <num_files> <max_depth>")
-        sys.exit(1)
-
-    parent_directory = sys.argv[1]
-    num_subdirs = int(sys.argv[2])
-    num_files = int(sys.argv[3])
-    max_depth = int(sys.argv[4])
-
-    statistics = create_files_in_directory(parent_directory, num_subdirs, num_files, max_depth)
+    parser = argparse.ArgumentParser(description="Create a random tree of source files and nested archives with known statistics")
+    parser.add_argument("parent_directory", help="Directory where subdirectories and files will be created")
+    parser.add_argument("num_subdirs", type=int, help="Number of subdirectories to create")
+    parser.add_argument("num_files", type=int, help="Number of files to create in each subdirectory")
+    parser.add_argument("max_depth", type=int, help="Maximum depth of the subdirectory structure")
+    parser.add_argument("--seed", type=int, help="Seed of the random generator; the same seed creates the same tree")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes filling and archiving subtrees in parallel (default: 1)")
+    parser.add_argument("--in-memory", action="store_true", help="Write generated files straight into archives built in memory instead of to disk and archiving them afterwards")
+
+    args = parser.parse_args()
+    parent_directory = args.parent_directory
+    num_subdirs = args.num_subdirs
+    num_files = args.num_files
+    max_depth = args.max_depth
+
+    statistics = create_files_in_directory(parent_directory, num_subdirs, num_files, max_depth, args.seed, args.workers, args.in_memory)
     output_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_statistics.txt")
     write_statistics_to_file(statistics, output_file_path, parent_directory, num_subdirs, num_files, max_depth)
 
     print(f"Created {statistics[0]} subdirectories with random depths and {statistics[1]} files each in {parent_directory}")
-    print(f"Statistics written to {output_file_path}")
\ No newline at end of file
+    print(f"Statistics written to {output_file_path}")
@@ -0,0 +1,88 @@
+import os
+
+import proprietary_term_search
+from loc_counter import archive_extensions
+
+# Per-file analyzers run by code_statistics.py alongside line counting. Every chunk of a file read
+# for counting is also fed to the analyzers, so an extra pass over the contents costs no extra
+# traversal, extraction or read. To add a pass, subclass FileAnalyzer and register it in
+# analyzer_types; it is then selected with --analyze.
+
+
+# Base class of the analyzers: start_file() and end_file() bracket the chunks of one text file, and
+# write_report() is called once the whole tree has been scanned. Binary files are never fed
+class FileAnalyzer:
+    def start_file(self, file):
+        pass
+
+    def feed(self, chunk):
+        pass
+
+    def end_file(self):
+        pass
+
+    def write_report(self, stats):
+        pass
+
+
+# Analyzer searching for the proprietary terms of proprietary_term_search.py and writing its report
+class TermAnalyzer(FileAnalyzer):
+    def __init__(self):
+        self.found_terms = []
+        self.search = None
+
+    def start_file(self, file):
+        self.search = proprietary_term_search.new_search(*split_archive_path(file))
+
+    def feed(self, chunk):
+        proprietary_term_search.search_chunk(self.search, chunk)
+
+    def end_file(self):
+        self.found_terms.extend(proprietary_term_search.end_search(self.search))
+        self.search = None
+
+    def write_report(self, stats):
+        binary_skips = {'files': stats['binary_files'], 'bytes': stats['binary_bytes_skipped']}
+        proprietary_term_search.write_report(self.found_terms, binary_skips)
+
+
+# Analyzers selectable with --analyze, by name
+analyzer_types = {
+    'terms': TermAnalyzer,
+}
+
+
+# Function to split the path of a streamed archive member into (path inside the outermost archive,
+# archive path), as proprietary_term_search.py reports them; loose files are reported with their
+# directory in place of the archive
+def split_archive_path(file):
+    parts = file.split('/')
+    for index, part in enumerate(parts[:-1]):
+        if part.endswith(archive_extensions):
+            return '/'.join(parts[index + 1:]), '/'.join(parts[:index + 1])
+    return file, os.path.dirname(file)
+
+
+# Stream wrapper feeding every chunk read from a file to the analyzers; head holds the bytes already
+# read from the stream, which are fed first, and finish() ends the file once it has been read whole
+class AnalyzedStream:
+    def __init__(self, stream, analyzers, file, head=b''):
+        self.stream = stream
+        self.analyzers = analyzers
+        for analyzer in analyzers:
+            analyzer.start_file(file)
+        self.feed(head)
+
+    def feed(self, chunk):
+        if chunk:
+            for analyzer in self.analyzers:
+                analyzer.feed(chunk)
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.feed(chunk)
+        return chunk
+
+    def finish(self):
+        for analyzer in self.analyzers:
+            analyzer.end_file()
@@ -1,38 +1,16 @@
+import argparse
+import io
 import os
+import posixpath
 import random
 import shutil
 import tarfile
+import time
 import zipfile
-from pathlib import Path
-
-# Mapping of programming languages to their possible file extensions
-file_extensions = {
-    "javascript": [".cjs", ".js", ".mjs"],
-    "typescript": [".ts", ".tsx"],
-    "c": [".c", ".h"],
-    "python": [".py"],
-    "r": [".r", ".rdata", ".rds"],
-    "java": [".java"],
-    "cpp": [".cc", ".cpp", ".cxx", ".h", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tcc", ".tpp"]
-}
-
-# Comment symbols for each file extension
-comment_symbols = {
-    '.py': ('#', ('"""', '"""')),
-    '.cjs': ('//', ('/*', '*/')),
-    '.js': ('//', ('/*', '*/')),
-    '.mjs': ('//', ('/*', '*/')),
-    '.ts': ('//', ('/*', '*/')),
-    '.tsx': ('//', ('/*', '*/')),
-    '.c': ('//', ('/*', '*/')),
-    '.h': ('//', ('/*', '*/')),
-    '.cpp': ('//', ('/*', '*/')),
-    '.cc': ('//', ('/*', '*/')),
-    '.cxx': ('//', ('/*', '*/')),
-    '.hpp': ('//', ('/*', '*/')),
-    '.hxx': ('//', ('/*', '*/')),
-    '.h++': ('//', ('/*', '*/'))
-}
+from functools import partial
+from multiprocessing import Pool
+
+import languages
 
 LICENSE_TERMS = [
     "License", "Copyright", "All rights reserved",
@@ -61,106 +39,148 @@ def generate_file_content():
     return content, position, term
 
 
-def create_file(file_path, content):
-    with open(file_path, 'w') as file:
-        file.write(content)
-
-
-def extract_archive(archive_path, extract_to):
+# Archive extensions processed and the mode each kind of tar is written with
+archive_extensions = ('.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tar')
+tar_write_modes = {'.tar.gz': 'w:gz', '.tgz': 'w:gz', '.tar.bz2': 'w:bz2'}
+
+
+# Function to return the name an archive member has once extracted, so "./LICENSE" is "LICENSE"
+def member_name(name):
+    return posixpath.normpath(name)
+
+
+# Function to add the generated files to a zip. The new members are appended after the existing ones
+# and only the central directory is rewritten, unless the zip already holds some of their names (a
+# second run on the same archives): it is then copied member by member into a new zip without them,
+# as extracting the files used to overwrite them, and a name added twice would be counted twice
+def append_to_zip(archive_path, generated_files):
+    names = {name for name, _, _, _ in generated_files}
+    with zipfile.ZipFile(archive_path, 'r') as source:
+        replaced = any(member_name(info.filename) in names for info in source.infolist())
+    if not replaced:
+        with zipfile.ZipFile(archive_path, 'a') as zipf:
+            for name, content, _, _ in generated_files:
+                zipf.writestr(name, content)
+        return
+
+    temp_path = archive_path + '.tmp'
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as source, zipfile.ZipFile(temp_path, 'w') as zipf:
+            for info in source.infolist():
+                if member_name(info.filename) in names:
+                    continue
+                with source.open(info) as member, zipf.open(info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as target:
+                    shutil.copyfileobj(member, target)
+            for name, content, _, _ in generated_files:
+                zipf.writestr(name, content)
+        os.replace(temp_path, archive_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Function to create a tar member for in-memory contents
+def tar_member(name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    info.mtime = time.time()
+    return info, io.BytesIO(data)
+
+
+# Function to add the generated files to a tar. A plain tar is appended to in place, unless it already
+# holds some of their names; otherwise, and always for a compressed tar, which cannot be appended to,
+# its members are streamed one by one into a new archive, leaving out the ones the new files replace,
+# followed by the new files, and the new archive replaces the original. Nothing is extracted to disk
+def append_to_tar(archive_path, generated_files):
+    new_members = [tar_member(name, content.encode()) for name, content, _, _ in generated_files]
+    names = {name for name, _, _, _ in generated_files}
+    write_mode = next((mode for ext, mode in tar_write_modes.items() if archive_path.endswith(ext)), None)
+    if write_mode is None:
+        with tarfile.open(archive_path, 'r') as tar:
+            replaced = any(member_name(member.name) in names for member in tar)
+        if not replaced:
+            with tarfile.open(archive_path, 'a') as tar:
+                for info, data in new_members:
+                    tar.addfile(info, data)
+            return
+        write_mode = 'w'
+
+    temp_path = archive_path + '.tmp'
+    try:
+        with tarfile.open(archive_path, 'r|*') as source, tarfile.open(temp_path, write_mode) as tar:
+            for member in source:
+                if member_name(member.name) in names:
+                    continue
+                tar.addfile(member, source.extractfile(member) if member.isfile() else None)
+            for info, data in new_members:
+                tar.addfile(info, data)
+        os.replace(temp_path, archive_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Function to add the generated files at the root of an archive; returns the log lines of the
+# inserted proprietary terms
+def add_files_to_archive(archive_path, generated_files):
     if archive_path.endswith('.zip'):
-        with zipfile.ZipFile(archive_path, 'r') as zipf:
-            zipf.extractall(extract_to)
+        append_to_zip(archive_path, generated_files)
     else:
-        with tarfile.open(archive_path, 'r:*') as tar:
-            tar.extractall(extract_to)
-
-
-def create_archive(archive_path, source_dir):
-    if archive_path.endswith('.zip'):
-        with zipfile.ZipFile(archive_path, 'w') as zipf:
-            for root, _, files in os.walk(source_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    zipf.write(file_path, arcname=os.path.relpath(file_path, source_dir))
-    else:
-        mode = 'w:gz' if archive_path.endswith(('.tar.gz', '.tgz')) else 'w:bz2' if archive_path.endswith(
-            '.tar.bz2') else 'w'
-        with tarfile.open(archive_path, mode) as tar:
-            tar.add(source_dir, arcname=os.path.basename(source_dir))
-
-
-def add_files_to_archive(archive_path, generated_files, temp_dir):
-    extract_dir = os.path.join(temp_dir, 'extracted')
-    Path(extract_dir).mkdir(parents=True, exist_ok=True)
+        append_to_tar(archive_path, generated_files)
+    return [f"File: {archive_path}, Position: {position}, Term: {term}\n" for _, _, position, term in generated_files]
 
-    extract_archive(archive_path, extract_dir)
 
-    for file_path, content, position, term in generated_files:
-        dest_path = os.path.join(extract_dir, os.path.relpath(file_path, temp_dir))
-        create_file(dest_path, content)
-
-        # Log the location of inserted proprietary term
-        with open(LOG_FILE, 'a') as log:
-            log.write(f"File: {archive_path}, Position: {position}, Term: {term}\n")
-
-    os.remove(archive_path)
-    create_archive(archive_path, extract_dir)
-    shutil.rmtree(extract_dir)
-
-
-def generate_files(directory, max_files=None):
-    Path(directory).mkdir(parents=True, exist_ok=True)
+# Function to generate the (name, content, position, term) of the files to insert, in memory
+def generate_files(max_files=None):
     generated_files = []
-
-    num_files = 0
-
-    for name in FILE_NAMES:
-        if max_files is not None and num_files >= max_files:
-            break
-        file_path = os.path.join(directory, name)
-        content, position, term = generate_file_content()
-        create_file(file_path, content)
-        generated_files.append((file_path, content, position, term))
-        num_files += 1
-
-    for ext in [ext for exts in file_extensions.values() for ext in exts]:
-        if max_files is not None and num_files >= max_files:
-            break
-        file_path = os.path.join(directory, f"file{ext}")
+    names = list(dict.fromkeys(FILE_NAMES + [f"file{ext}" for ext in languages.extension_languages]))
+    for name in names[:max_files]:
         content, position, term = generate_file_content()
-        create_file(file_path, content)
-        generated_files.append((file_path, content, position, term))
-        num_files += 1
+        generated_files.append((name, content, position, term))
+    return generated_files
 
-    return generated_files[:max_files] if max_files is not None else generated_files
 
+# Function to insert generated files into one archive (run in the pool workers)
+def process_archive(archive_path, max_files=None):
+    return add_files_to_archive(archive_path, generate_files(max_files))
 
-def process_archives(parent_directory, temp_dir, max_files=None):
+
+# Function to find the archives in the parent directory
+def find_archives(parent_directory):
     for root, _, files in os.walk(parent_directory):
         for file in files:
-            archive_path = os.path.join(root, file)
-            if any(archive_path.endswith(ext) for ext in ['.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tar']):
-                generated_files = generate_files(temp_dir, max_files)
-                add_files_to_archive(archive_path, generated_files, temp_dir)
+            if file.endswith(archive_extensions):
+                yield os.path.join(root, file)
+
+
+# Function to process every archive, several at a time with workers; the log of the inserted terms
+# is written by this process alone, through a single buffered writer
+def process_archives(parent_directory, max_files=None, workers=1):
+    archives = list(find_archives(parent_directory))
+    process = partial(process_archive, max_files=max_files)
+    with open(LOG_FILE, 'w') as log:
+        if workers > 1:
+            # Reseed every worker, or they would all insert the same terms
+            with Pool(processes=workers, initializer=random.seed) as pool:
+                for archive_path, log_lines in zip(archives, pool.imap(process, archives)):
+                    log.writelines(log_lines)
+                    print(f"Updated archive: {archive_path}")
+        else:
+            for archive_path in archives:
+                log.writelines(process(archive_path))
                 print(f"Updated archive: {archive_path}")
-                shutil.rmtree(temp_dir)
-                Path(temp_dir).mkdir(parents=True, exist_ok=True)
 
 
-def main(parent_directory, max_files=None):
-    temp_dir = 'temp_generated_files'
-    process_archives(parent_directory, temp_dir, max_files)
-    shutil.rmtree(temp_dir)
+def main(parent_directory, max_files=None, workers=1):
+    process_archives(parent_directory, max_files, workers)
 
 
 if __name__ == "__main__":
-    import sys
+    parser = argparse.ArgumentParser(description="Insert files containing proprietary terms into every archive of a directory")
+    parser.add_argument("parent_directory", help="Directory containing the archives to update")
+    parser.add_argument("max_files", type=int, nargs="?", default=10, help="Maximum files to insert per archive (default: 10)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of archives updated in parallel (default: 1)")
 
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: python insert_proprietary_terms.py <parent_directory> [max_files_per_subdirectory]")
-    else:
-        parent_directory = sys.argv[1]
-        max_files = int(sys.argv[2]) if len(sys.argv) == 3 else 10
-        if os.path.exists(LOG_FILE):
-            os.remove(LOG_FILE)  # Clear the previous log file
-        main(parent_directory, max_files)
+    args = parser.parse_args()
+    main(args.parent_directory, args.max_files, args.workers)
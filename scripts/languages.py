@@ -0,0 +1,311 @@
+import os
+import re
+
+# Language registry shared by the scanners and the generators: how each language is recognised
+# (extensions, file names, #! interpreters) and how it writes comments. The definitions are compiled
+# once, at import, into lookup tables and per-language classifiers, so resolving the language of a
+# file is a couple of dict lookups and the counting patterns are never rebuilt.
+
+# Languages by name. Every entry lists its extensions (lowercase), exact file names, #! interpreters,
+# line comment markers, block comment (open, close) pairs and string delimiters; 'nested' marks block
+# comments that may contain blocks of their own, 'multiline_strings' the delimiters of strings that
+# span lines, and 'docstring' block styles that only open a comment where no code precedes them on
+# the line (elsewhere they start a string), and 'data_extensions' the extensions of data files that
+# may be stored in a binary format, so their contents are sniffed before they are counted. An
+# extension or name claimed twice belongs to the first language
+c_strings = ['"', "'"]
+language_definitions = {
+    'javascript': {'extensions': ['.cjs', '.js', '.mjs', '.jsx'], 'interpreters': ['node', 'nodejs'],
+                   'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings, 'multiline_strings': ['`']},
+    'typescript': {'extensions': ['.ts', '.tsx', '.mts', '.cts'], 'interpreters': ['ts-node', 'deno'],
+                   'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings, 'multiline_strings': ['`']},
+    'c': {'extensions': ['.c', '.h'], 'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'python': {'extensions': ['.py', '.pyw', '.pyi'], 'filenames': ['SConstruct', 'SConscript'],
+               'interpreters': ['python', 'python2', 'python3', 'pypy', 'pypy3'],
+               'line': ['#'], 'block': [('"""', '"""'), ("'''", "'''")], 'docstring': True, 'strings': c_strings},
+    # R has no block comments; /* */ is kept from the original table, which the corpus generator and
+    # earlier reports follow. .rdata and .rds are usually gzip-compressed serialized objects
+    'r': {'extensions': ['.r', '.rdata', '.rds'], 'data_extensions': ['.rdata', '.rds'],
+          'interpreters': ['Rscript'], 'line': ['#'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'java': {'extensions': ['.java'], 'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'cpp': {'extensions': ['.cpp', '.cc', '.cxx', '.hpp', '.hxx', '.h++', '.inl', '.ipp', '.tcc', '.tpp'],
+            'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'csharp': {'extensions': ['.cs'], 'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'go': {'extensions': ['.go'], 'line': ['//'], 'block': [('/*', '*/')], 'strings': c_strings,
+           'multiline_strings': ['`']},
+    # Lifetimes and generics use ' on their own, so only " delimits strings
+    'rust': {'extensions': ['.rs'], 'line': ['//'], 'block': [('/*', '*/')], 'nested': True, 'strings': ['"']},
+    'swift': {'extensions': ['.swift'], 'line': ['//'], 'block': [('/*', '*/')], 'nested': True, 'strings': ['"']},
+    'kotlin': {'extensions': ['.kt', '.kts'], 'line': ['//'], 'block': [('/*', '*/')], 'nested': True,
+               'strings': c_strings},
+    'scala': {'extensions': ['.scala', '.sc'], 'line': ['//'], 'block': [('/*', '*/')], 'nested': True,
+              'strings': ['"']},
+    'php': {'extensions': ['.php'], 'interpreters': ['php'], 'line': ['//', '#'], 'block': [('/*', '*/')],
+            'strings': c_strings},
+    'css': {'extensions': ['.css'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'sql': {'extensions': ['.sql'], 'line': ['--'], 'block': [('/*', '*/')], 'strings': c_strings},
+    'haskell': {'extensions': ['.hs'], 'interpreters': ['runhaskell'], 'line': ['--'], 'block': [('{-', '-}')],
+                'nested': True, 'strings': ['"']},
+    'lua': {'extensions': ['.lua'], 'interpreters': ['lua'], 'line': ['--'], 'block': [('--[[', ']]')],
+            'strings': c_strings},
+    'shell': {'extensions': ['.sh', '.bash', '.zsh', '.ksh'],
+              'filenames': ['.bashrc', '.bash_profile', '.profile', '.zshrc'],
+              'interpreters': ['sh', 'bash', 'zsh', 'ksh', 'dash'], 'line': ['#'], 'strings': c_strings},
+    'perl': {'extensions': ['.pl', '.pm'], 'interpreters': ['perl'], 'line': ['#'], 'block': [('=pod', '=cut')],
+             'strings': c_strings},
+    'ruby': {'extensions': ['.rb'], 'filenames': ['Rakefile', 'Gemfile'], 'interpreters': ['ruby'],
+             'line': ['#'], 'block': [('=begin', '=end')], 'strings': c_strings},
+    'make': {'extensions': ['.mk'], 'filenames': ['Makefile', 'makefile', 'GNUmakefile'],
+             'interpreters': ['make'], 'line': ['#']},
+    'cmake': {'extensions': ['.cmake'], 'filenames': ['CMakeLists.txt'], 'line': ['#'], 'block': [('#[[', ']]')],
+              'strings': ['"']},
+    'dockerfile': {'extensions': ['.dockerfile'], 'filenames': ['Dockerfile', 'Containerfile'], 'line': ['#']},
+    'yaml': {'extensions': ['.yaml', '.yml'], 'line': ['#'], 'strings': c_strings},
+    'toml': {'extensions': ['.toml'], 'line': ['#'], 'strings': c_strings},
+    'ini': {'extensions': ['.ini', '.cfg'], 'line': [';', '#']},
+    'markup': {'extensions': ['.html', '.htm', '.xml', '.svg', '.vue'], 'block': [('<!--', '-->')]},
+}
+
+# Syntax assumed for files no rule recognises: unknown extensions, and files without an extension
+# that are neither known by name nor start with a known #! line
+default_definition = {'line': ['#'], 'block': [('"""', '"""')], 'docstring': True}
+
+
+# Function to build a pattern finding any of the given markers, and escaped characters first when
+# escaped is set
+def markers_pattern(markers, escaped=False):
+    alternatives = [re.escape(marker) for marker in sorted(markers, key=len, reverse=True)]
+    if escaped:
+        alternatives.insert(0, r'\\.')
+    # No markers at all gives a pattern that never matches
+    return '|'.join(alternatives) or '(?!)'
+
+
+# Function to list the tokens of a language that change the state of a line, as {token: (kind,
+# markers ending it, whether those may be escaped, closing marker)}. Strings and docstrings end at an
+# unescaped delimiter; nested blocks also look for their opener
+def language_tokens(definition):
+    tokens = {}
+    for marker in definition.get('line', ()):
+        tokens[marker] = ('line', (), False, None)
+    for opener, closer in definition.get('block', ()):
+        if definition.get('docstring'):
+            tokens[opener] = ('docstring', (closer,), True, closer)
+        elif definition.get('nested'):
+            tokens[opener] = ('block', (opener, closer), False, closer)
+        else:
+            tokens[opener] = ('block', (closer,), False, closer)
+    for kind, key in (('string', 'strings'), ('multiline', 'multiline_strings')):
+        for delimiter in definition.get(key, ()):
+            tokens.setdefault(delimiter, (kind, (delimiter,), True, delimiter))
+    return tokens
+
+
+# Function to build a pattern matching marker where it does not start one of the longer tokens
+def lone_marker(marker, tokens):
+    rests = [re.escape(token[len(marker):]) for token in tokens if len(token) > len(marker) and token.startswith(marker)]
+    # The lookahead follows the marker, so that every alternative of a pattern starts with a literal
+    # and the regex engine can skip ahead to the characters that may start one
+    return re.escape(marker) + ('(?!' + '|'.join(rests) + ')' if rests else '')
+
+
+# Function to compile the tokens of a language for lines of one type, decoded text or raw bytes.
+# Returns the tokens, each with its kind, the pattern finding where it ends and its closing marker,
+# and these patterns:
+# - token_pattern finds the next token, longest first so '--[[' is not taken for '--', or a whole
+#   string closed on the line it opens, which is then skipped in a single step
+# - code_line matches a whole line of code: one without tokens outside such strings, which holds
+#   code and leaves no comment or string open
+# - comment_start matches the start of a line that is a line comment from its first character
+# - span_pattern finds every comment and string of a whole buffer, longest token first like
+#   token_pattern (see compile_span_pattern()). The comments are the spans starting with one of
+#   comment_openers, and those starting with one of docstring_openers where no code precedes them
+#   on the line; a span starting with one of nested_openers is only the opener, as the end of a
+#   block that nests has to be found by counting the blocks it holds. Single-line strings only
+#   matter where they hide the opener of another span, so a buffer is searched for these first,
+#   with opener_patterns
+# - blank_line matches the line break before a line holding nothing but whitespace; the line itself
+#   is only looked ahead at, which the regex engine backtracks out of faster. space_blank_line does
+#   the same in a fraction of the time where the only whitespace but line breaks is spaces, that is
+#   without any of other_whitespace (and, for text, without any non-ASCII character)
+def compile_syntax(tokens, text):
+    def compile_pattern(source):
+        return re.compile(source if text else source.encode('ascii'))
+
+    def encode(marker):
+        return marker if text or marker is None else marker.encode('ascii')
+
+    ordered = sorted(tokens, key=len, reverse=True)
+    alternatives = []
+    strings = []
+    for token in ordered:
+        if tokens[token][0] in ('string', 'multiline') and len(token) == 1:
+            # Not the start of a longer token, such as the ''' of a Python docstring
+            body = '[^' + re.escape(token) + r'\\\n]*'
+            strings.append(lone_marker(token, ordered) + body + r'(?:\\.' + body + ')*' + re.escape(token))
+            alternatives.append(strings[-1])
+        alternatives.append(re.escape(token))
+
+    # Characters that can start a token either start a whole string or no token at all, so the plain
+    # runs in between cannot be split two ways and a line that does not match fails fast
+    starts = sorted({token[0] for token in ordered})
+    plain = '[^' + ''.join(re.escape(start) for start in starts) + r'\n]*'
+    others = [lone_marker(start, ordered) for start in starts if start not in tokens]
+    code_line = plain + '(?:(?:' + '|'.join(strings + others or ['(?!)']) + ')' + plain + ')*'
+    comment_start = '|'.join(lone_marker(token, ordered) for token in ordered if tokens[token][0] == 'line') or '(?!)'
+    comment_openers = tuple(encode(token) for token in ordered if tokens[token][0] in ('line', 'block'))
+    docstring_openers = tuple(encode(token) for token in ordered if tokens[token][0] == 'docstring')
+    nested_openers = tuple(encode(token) for token in ordered if tokens[token][0] == 'block' and len(tokens[token][1]) > 1)
+    # The openers of every span but single-line strings, in one pattern for each character they start
+    # with: a literal the regex engine skips ahead to faster than to any of several characters
+    span_openers = [token for token in ordered if tokens[token][0] != 'string']
+    opener_patterns = tuple(compile_pattern('|'.join(re.escape(token) for token in span_openers if token[0] == first))
+                            for first in sorted({token[0] for token in span_openers}))
+    return {
+        'tokens': {encode(token): (kind, compile_pattern(markers_pattern(ends, escaped)), encode(closer))
+                   for token, (kind, ends, escaped, closer) in tokens.items()},
+        # No tokens at all gives a pattern that never matches
+        'token_pattern': compile_pattern('|'.join(alternatives) or '(?!)'),
+        'code_line': compile_pattern(code_line),
+        'comment_start': compile_pattern(comment_start),
+        'span_pattern': compile_span_pattern(tokens, ordered, text),
+        'comment_openers': comment_openers,
+        'docstring_openers': docstring_openers,
+        'nested_openers': nested_openers,
+        'opener_patterns': opener_patterns,
+        'blank_line': compile_pattern(r'\n(?=[^\S\n]*\n)'),
+        'space_blank_line': compile_pattern(r'\n(?= *\n)'),
+        'other_whitespace': tuple(encode(char) for char in '\t\v\f\r' + ('\x1c\x1d\x1e\x1f' if text else '')),
+        'newline': encode('\n'),
+    }
+
+
+# Function to build the pattern of the body of a span up to the first closer, unrolled so that a run
+# of characters that cannot end it is consumed in a single step. Escaped bodies skip the character
+# after a backslash, and single line ones stop at a line break, which a backslash never escapes
+def span_body(closer, escaped, single_line):
+    first = re.escape(closer[0])
+    run = '[^' + first + (r'\\' if escaped else '') + (r'\n' if single_line else '') + ']*'
+    steps = []
+    if escaped:
+        steps.append(r'\\[^\n]' if single_line else r'\\[\s\S]')
+    if len(closer) > 1:
+        steps.append(first + '(?!' + re.escape(closer[1:]) + ')')
+    return run + ('(?:(?:' + '|'.join(steps) + ')' + run + ')*' if steps else '')
+
+
+# Function to compile the span_pattern of compile_syntax(), or return None when the language needs
+# a line by line scan: a string delimiter starting like a comment. Strings that cannot span lines
+# end with the line, a block comment, docstring or multi-line string left open runs to the end of
+# the buffer, and an escape in a string skips the next character, but never a line break in a
+# single-line string. Comments separated by nothing but whitespace are matched as one span, so that
+# a run of comment lines is a single step; only a span left open runs to the end of the buffer
+def compile_span_pattern(tokens, ordered, text):
+    comment_openers = [token for token in ordered if tokens[token][0] in ('line', 'block')]
+    for token, (kind, _, _, _) in tokens.items():
+        if kind in ('string', 'multiline') and token.startswith(tuple(comment_openers)):
+            return None
+
+    closed_comments = []
+    for token in ordered:
+        kind, ends, _, closer = tokens[token]
+        if kind == 'line':
+            closed_comments.append(lone_marker(token, ordered) + r'[^\n]*')
+        elif kind == 'block' and len(ends) == 1:
+            closed_comments.append(lone_marker(token, ordered) + span_body(closer, False, False) + re.escape(closer))
+    comments_after = r'(?:\s*(?:' + '|'.join(closed_comments) + '))*' if closed_comments else ''
+
+    alternatives = []
+    for token in ordered:
+        kind, ends, escaped, closer = tokens[token]
+        opener = re.escape(token)
+        if kind == 'line':
+            alternatives.append(opener + r'[^\n]*' + comments_after)
+        elif kind == 'block' and len(ends) > 1:
+            alternatives.append(opener)  # nested, see compile_syntax()
+        elif kind == 'block':
+            alternatives.append(opener + span_body(closer, False, False) + '(?:' + re.escape(closer) + comments_after + r'|\Z)')
+        elif kind == 'string':
+            alternatives.append(opener + span_body(closer, True, True) + '(?:' + re.escape(closer) + r'|\\?(?=\n))')
+        else:
+            alternatives.append(opener + span_body(closer, escaped, False) + '(?:' + re.escape(closer) + r'|\Z)')
+    source = '|'.join(alternatives) or '(?!)'
+    return re.compile(source if text else source.encode('ascii'))
+
+
+# Function to compile a language definition into the entry the classifiers use: its markers, for
+# the generator, and its tokens compiled for decoded lines ('text') and raw buffers ('bytes')
+def compile_language(name, definition):
+    return {
+        'name': name,
+        'line_comments': tuple(definition.get('line', ())),
+        'block_comments': tuple(tuple(pair) for pair in definition.get('block', ())),
+        'text': compile_syntax(language_tokens(definition), True),
+        'bytes': compile_syntax(language_tokens(definition), False),
+    }
+
+
+# Compiled languages by name, the lookup tables resolving a file to one of them, and the extensions
+# of data files that may be binary
+languages = {}
+extension_languages = {}
+filename_languages = {}
+interpreter_languages = {}
+data_extensions = set()
+for language_name, language_definition in language_definitions.items():
+    languages[language_name] = compile_language(language_name, language_definition)
+    for extension in language_definition['extensions']:
+        extension_languages.setdefault(extension, languages[language_name])
+    data_extensions.update(language_definition.get('data_extensions', ()))
+    for filename in language_definition.get('filenames', ()):
+        filename_languages.setdefault(filename, languages[language_name])
+    for interpreter in language_definition.get('interpreters', ()):
+        interpreter_languages.setdefault(interpreter, languages[language_name])
+
+default_language = compile_language('default', default_definition)
+
+
+# Function to resolve a file to its language from its name alone; returns None when only the
+# contents can tell. Exact file names come first, so CMakeLists.txt is not looked up as '.txt'
+def language_by_name(file):
+    name = os.path.basename(file)
+    language = filename_languages.get(name)
+    if language is None:
+        language = extension_languages.get(os.path.splitext(name)[1].lower())
+    return language
+
+
+# Function to resolve the #! line a file starts with (str or bytes) to a language; returns the
+# default language when there is none or its interpreter is unknown
+def language_by_shebang(first_line):
+    if isinstance(first_line, bytes):
+        end = first_line.find(b'\n')
+        first_line = first_line[:end if end != -1 else 256].decode('ascii', 'ignore')
+    else:
+        first_line = first_line.split('\n', 1)[0]
+    if not first_line.startswith('#!'):
+        return default_language
+    words = first_line[2:].split()
+    if words and os.path.basename(words[0]) == 'env':
+        # '#!/usr/bin/env [-S] python3 ...'
+        words = [word for word in words[1:] if not word.startswith('-')]
+    if not words:
+        return default_language
+    interpreter = os.path.basename(words[0])
+    # python3.11 is python3, and then python
+    return (interpreter_languages.get(interpreter) or interpreter_languages.get(interpreter.rstrip('0123456789.'))
+            or default_language)
+
+
+# Function to resolve a file to its language from its name, or from the #! line its contents start
+# with (head, raw bytes or decoded text) when the name is not enough
+def language_of(file, head=b''):
+    language = language_by_name(file)
+    if language is None:
+        return language_by_shebang(head)
+    return language
+
+
+# Function to return the language of files with an extension, or the default language
+def extension_language(extension):
+    return extension_languages.get(extension.lower(), default_language)
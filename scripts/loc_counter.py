@@ -0,0 +1,766 @@
+import array
+import bisect
+import codecs
+import csv
+import hashlib
+import io
+import json
+import itertools
+import locale
+import os
+import re
+import tarfile
+import zipfile
+from collections import Counter
+
+import languages
+
+try:
+    import xxhash
+except ImportError:  # content_hash() falls back to blake2b
+    xxhash = None
+
+# Shared line counting engine used by code_statistics.py (serial) and
+# code_statistics_multiprocessing.py (parallel) so both produce the same report.
+
+# Dictionary of folder names
+folder_names = {
+    "git": [".git"],
+    # "config": [".config"],
+    # "cache": [".cache"],
+    # Add more folder names as needed
+}
+
+folder_names_list = [name for names in folder_names.values() for name in names]
+
+# Archive suffixes recognised by the scanners
+archive_extensions = ('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz')
+
+# Size of the chunks files are decoded and classified in
+chunk_size = 1 << 20
+
+
+# Function to determine the language a file is reported under: its extension, or its file name if
+# it has none. The comment syntax it is counted with comes from languages.py
+def get_lang(file):
+    extension = os.path.splitext(file)[1].lower()
+    if extension:
+        return extension
+    else:
+        return os.path.basename(file)
+
+
+# Function to check whether a file found during a walk should be counted
+def is_countable(file):
+    return not file.endswith(archive_extensions) and not file.endswith('.gitkeep')
+
+
+# Names of the reports the scanners write into the search directory
+report_file_name = 'codebase_report.txt'
+tree_report_file_name = 'codebase_tree.txt'
+
+
+# Function to collect the files a scan writes, so that the walk does not count them and a rerun over
+# the same tree reports the same totals: the reports in the search directory and the further paths
+# given (None for outputs not written), by file name and then absolute path
+def scan_outputs(search_dir, *paths):
+    outputs = {}
+    for path in (os.path.join(search_dir, report_file_name), os.path.join(search_dir, tree_report_file_name)) + paths:
+        if path is not None:
+            path = os.path.abspath(path)
+            outputs.setdefault(os.path.basename(path), set()).add(path)
+    return outputs
+
+
+# Function to check whether a file found during a walk is one of the outputs of scan_outputs(), if
+# any; only files with the name of an output have their path resolved
+def is_scan_output(root, file, outputs):
+    return outputs is not None and file in outputs and os.path.abspath(os.path.join(root, file)) in outputs[file]
+
+
+# Function to check whether a path inside a tree or archive lies in an ignored folder
+def in_ignored_folder(path):
+    return any(part in folder_names_list for part in path.replace('\\', '/').split('/')[:-1])
+
+
+# Function to total the size of the files under a directory, outside ignored folders
+def directory_size(directory):
+    size = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in folder_names_list]
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass  # unreadable files are reported when they are counted
+    return size
+
+
+# Function to decode a binary stream the same way open(file, 'r', errors='ignore') does, into chunks
+# of whole lines, line breaks included, but for the last one; head holds bytes already read from the
+# stream. Most files fit in a chunk, and are decoded in one go rather than through the incremental
+# decoders
+def iter_text_chunks(stream, chunk_size=chunk_size, head=b''):
+    encoding = locale.getpreferredencoding(False)
+    chunk = head + stream.read(chunk_size)
+    more = stream.read(chunk_size) if chunk else b''
+    if not more:
+        text = chunk.decode(encoding, errors='ignore')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if text:
+            yield text
+        return
+
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors='ignore'), translate=True)
+    pending = ''
+    for chunk in itertools.chain((chunk, more), iter(lambda: stream.read(chunk_size), b'')):
+        text = pending + decoder.decode(chunk)
+        cut = text.rfind('\n') + 1
+        if cut:
+            yield text[:cut]
+        pending = text[cut:]
+    text = pending + decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+# Function to yield (member name, binary stream, size) for the files of an archive without extracting it
+def iter_archive_members(fileobj, archive_name):
+    if archive_name.endswith('.zip'):
+        # Zip needs random access to its central directory; nested members are buffered in memory
+        try:
+            seekable = fileobj.seekable()
+        except AttributeError:
+            seekable = False  # members of a streamed tar cannot report seekability
+        if not seekable:
+            fileobj = io.BytesIO(fileobj.read())
+        with zipfile.ZipFile(fileobj, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                with zip_ref.open(info) as member:
+                    yield info.filename, member, info.file_size
+    elif archive_name.endswith(archive_extensions):
+        # Stream mode ('r|*') reads members sequentially and never seeks
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                yield member.name, tar.extractfile(member), member.size
+    else:
+        raise ValueError(f"Unknown archive format for file '{archive_name}'")
+
+
+# Function to classify one stripped, non-blank line (str or bytes) with the tokens of a language,
+# starting in state: None, or the (kind, token, depth) of a block comment or multi-line string left
+# open by an earlier line. The line is scanned once, left to right, from one token to the next:
+# comment markers inside strings are skipped, a block may close on the line it opens, and anything
+# but whitespace outside comments is code. Returns whether the line holds code, and the state the
+# next line starts in
+def scan_line(line, state, syntax):
+    tokens = syntax['tokens']
+    position = 0
+    code = False
+    match = None
+    while True:
+        if state is not None:
+            kind, token, depth = state
+            _, end_pattern, closer = tokens[token]
+            while depth:
+                end = end_pattern.search(line, position)
+                if end is None:
+                    break
+                position = end.end()
+                found = end.group()
+                if found == closer:
+                    depth -= 1
+                elif found == token:
+                    depth += 1  # a nested block; escapes are skipped
+            if kind != 'block':
+                code = True
+            if depth:
+                # Strings that cannot span lines end with the line
+                return code, None if kind == 'string' else (kind, token, depth)
+            state = None
+        if match is None:
+            match = syntax['token_pattern'].search(line, position)
+            if match is None:
+                return code or bool(line[position:].strip()), None
+        if not code and line[position:match.start()].strip():
+            code = True
+        token = match.group()
+        position = match.end()
+        match = None
+        if token not in tokens:
+            code = True  # a whole string, closed on the same line
+            continue
+        kind = tokens[token][0]
+        if kind == 'line':
+            return code, None
+        if kind == 'docstring':
+            # Only opens a comment where no code precedes it, as a docstring does
+            kind = 'multiline' if code else 'block'
+        state = (kind, token, 1)
+
+
+# Function to classify lines as code, comment or blank with the syntax of a language (see
+# languages.py); a line is a comment when all it holds besides whitespace is comments. Returns a
+# Counter with total (non-blank), code, comments and blank
+def count_lines(lines, language):
+    syntax = language['text']
+    code_line = syntax['code_line']
+    comment_start = syntax['comment_start']
+
+    loc = 0
+    comment_loc = 0
+    blank_loc = 0
+    state = None  # block comment or string left open by the previous line
+
+    for line in lines:
+        line = line.strip()
+        if line:
+            loc += 1
+            if state is None:
+                # Most lines are plain code or line comments and need no scan
+                if code_line.fullmatch(line):
+                    continue
+                if comment_start.match(line):
+                    comment_loc += 1
+                    continue
+                code, state = scan_line(line, None, syntax)
+            else:
+                code, state = scan_line(line, state, syntax)
+            if not code:
+                comment_loc += 1
+        else:
+            blank_loc += 1
+
+    return Counter(total=loc, code=loc - comment_loc, comments=comment_loc, blank=blank_loc)
+
+
+# Function to find where a block comment or multi-line string read from position ends, with the
+# markers ending it as scan_line() does, depth blocks being open. Returns the position after its
+# closing marker and 0, or the end of the buffer and the depth still open when it does not close
+def close_span(buffer, position, token, token_syntax, depth):
+    _, end_pattern, closer = token_syntax
+    while depth:
+        end = end_pattern.search(buffer, position)
+        if end is None:
+            return len(buffer), depth
+        position = end.end()
+        found = end.group()
+        if found == closer:
+            depth -= 1
+        elif found == token:
+            depth += 1  # a nested block; escapes are skipped
+    return position, 0
+
+
+# Function to count the lines of a buffer of whole lines, padded with a line break on both ends, that
+# hold nothing but comments and whitespace. The language's opener_patterns (see languages.py) find
+# where the next comment, docstring or multi-line string may start, and its span_pattern, searched
+# from the start of that line, whether a string hides it. The comment lines are counted from the
+# offsets of the spans found, and the lines between them are only looked at where a span starts or
+# ends, so the Python-level work is per span rather than per line and nothing is copied but the few
+# characters around them. blanks lists, in order, where the blank lines of the buffer start (see
+# count_chunks()). state is that of scan_line(): the block comment or multi-line string left open
+# by the previous buffer, if any. Returns the number of comment lines and the state the next buffer
+# starts in
+def count_comment_lines(buffer, syntax, blanks, state=None):
+    newline = syntax['newline']
+    tokens = syntax['tokens']
+    comment_openers = syntax['comment_openers']
+    docstring_openers = syntax['docstring_openers']
+    nested_openers = syntax['nested_openers']
+    opener_searches = [pattern.search for pattern in syntax['opener_patterns']]
+    search = syntax['span_pattern'].search
+    find = buffer.find
+    rfind = buffer.rfind
+    end = len(buffer)
+    upcoming = [-1] * len(opener_searches) or [end]  # where the openers are next found, end if they are not
+
+    comment_loc = 0
+    line_code = False  # whether the line read so far holds code
+    line_comment = False  # and whether it holds a comment
+    position = 1
+    if state is not None:
+        # The buffer starts in a span left open, which ends as it does in scan_line(); the lines it
+        # holds whole are comments unless blank if it is a block comment, and code otherwise
+        kind, token, depth = state
+        position, depth = close_span(buffer, position, token, tokens[token], depth)
+        if position == end:
+            if kind == 'block':
+                comment_loc = buffer.count(newline, 0, end - 1) - len(blanks)
+            return comment_loc, (kind, token, depth)
+        last_break = rfind(newline, 0, position)
+        if kind == 'block':
+            comment_loc = buffer.count(newline, 0, last_break) - bisect.bisect_left(blanks, last_break)
+            line_comment = True
+        else:
+            line_code = True
+
+    while True:
+        # The next span but a single-line string starts with the first opener found outside one;
+        # only the line it is on is searched for the strings before it
+        scan = position
+        while True:
+            start = min(upcoming)
+            while start < scan:
+                index = upcoming.index(start)
+                found = opener_searches[index](buffer, scan)
+                upcoming[index] = end if found is None else found.start()
+                start = min(upcoming)
+            if start == end:
+                # The rest of the buffer is code and whitespace, so only the line it starts on counts
+                if line_comment and not line_code and not buffer[position:find(newline, position)].strip():
+                    comment_loc += 1
+                return comment_loc, None
+            gap_break = rfind(newline, position, start)
+            span_start, span_end = search(buffer, scan if gap_break < scan else gap_break + 1).span()
+            while span_end <= start and span_start < start:
+                span_start, span_end = search(buffer, span_end).span()
+            if span_start == start:
+                break
+            scan = span_end  # the opener is inside a string
+
+        # Up to the span, code and whitespace: lines it ends are finished and lines it holds whole
+        # are code or blank, so only its first and last lines are looked at
+        if start > position:
+            if gap_break == -1:
+                if not line_code and buffer[position:start].strip():
+                    line_code = True
+            else:
+                if line_comment and not line_code and (buffer.startswith(newline, position) or not buffer[position:find(newline, position)].strip()):
+                    comment_loc += 1
+                line_comment = False
+                line_code = start > gap_break + 1 and bool(buffer[gap_break + 1:start].strip())
+
+        position = span_end
+        comment = buffer.startswith(comment_openers, start)
+        if comment:
+            if nested_openers and buffer.startswith(nested_openers, start):
+                token = buffer[start:position]
+                position, depth = close_span(buffer, position, token, tokens[token], 1)
+        elif docstring_openers and not line_code:
+            comment = buffer.startswith(docstring_openers, start)  # a docstring, where no code precedes it
+
+        # A span ends with its closing marker or, for a line comment, its text, so the line it ends on
+        # is not blank so far
+        last_break = rfind(newline, start, position)
+        if comment:
+            if last_break != -1:
+                # The lines the comment holds whole are comments unless blank, and so is the line it
+                # starts on unless it holds code; a blank line never holds the start of a comment
+                if not line_code:
+                    comment_loc += 1
+                comment_loc += buffer.count(newline, start, last_break)
+                comment_loc -= bisect.bisect_left(blanks, last_break) - bisect.bisect_left(blanks, start)
+                line_code = False
+            line_comment = True
+        else:
+            if last_break != -1:
+                line_comment = False
+            line_code = True
+
+        if position == end:
+            # Left open, as closing markers are never line breaks: the next buffer starts inside it
+            token = syntax['token_pattern'].match(buffer, start).group()
+            kind = tokens[token][0]
+            if kind == 'docstring':
+                kind = 'block' if comment else 'multiline'
+            return comment_loc, (kind, token, depth if buffer.startswith(nested_openers, start) else 1)
+
+
+# Function to classify the lines of chunks of whole lines (see iter_text_chunks()), decoded text or raw
+# bytes with the matching syntax of a language, a chunk at a time with count_comment_lines(). Returns
+# the same Counter as count_lines()
+def count_chunks(chunks, syntax):
+    newline = syntax['newline']
+    text = isinstance(newline, str)
+    lines = 0
+    comment_loc = 0
+    blank_loc = 0
+    state = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer = newline + chunk + (newline[:0] if chunk.endswith(newline) else newline)
+        lines += buffer.count(newline) - 1
+        if (text and not chunk.isascii()) or any(char in chunk for char in syntax['other_whitespace']):
+            blank_line = syntax['blank_line']
+        else:
+            blank_line = syntax['space_blank_line']
+        blanks = list(map(re.Match.start, blank_line.finditer(buffer)))
+        blank_loc += len(blanks)
+        chunk_comment_loc, state = count_comment_lines(buffer, syntax, blanks, state)
+        comment_loc += chunk_comment_loc
+    loc = lines - blank_loc
+    return Counter(total=loc, code=loc - comment_loc, comments=comment_loc, blank=blank_loc)
+
+
+# Function to classify the lines of a raw buffer in bulk, without decoding it; see count_chunks().
+# Only ASCII whitespace counts as blank, and lone carriage returns, which are line breaks in text
+# mode, leave the (rare) files holding them to the text classifier
+def count_buffer(data, language):
+    if language['bytes']['span_pattern'] is None or (b'\r' in data and data.count(b'\r') != data.count(b'\r\n')):
+        return count_text(iter_text_chunks(io.BytesIO(data)), language)
+    return count_chunks((data,), language['bytes'])
+
+
+# Function to classify the lines of decoded chunks of text (see iter_text_chunks()); see count_chunks().
+# Languages span_pattern cannot handle are classified line by line with count_lines()
+def count_text(chunks, language):
+    if language['text']['span_pattern'] is None:
+        return count_lines((line for chunk in chunks for line in chunk.removesuffix('\n').split('\n')), language)
+    return count_chunks(chunks, language['text'])
+
+
+# Function to resolve the language of a file from its name, or from the first of its decoded chunks
+# when the name is not enough; returns the language and the chunks, first one included
+def file_language(file, chunks):
+    language = languages.language_by_name(file)
+    if language is None:
+        chunks = iter(chunks)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return languages.default_language, ()
+        language = languages.language_by_shebang(first_chunk)
+        chunks = itertools.chain((first_chunk,), chunks)
+    return language, chunks
+
+
+# Function to count the lines of a file on disk, or of already decoded chunks of it when given (see
+# iter_text_chunks())
+def count_file(file, chunks=None):
+    if chunks is None:
+        with open(file, 'rb') as f:
+            return count_file(file, iter_text_chunks(f))
+    language, chunks = file_language(file, chunks)
+    return count_text(chunks, language)
+
+
+# Function to count the lines of a file on disk, or of its raw contents when given, with count_buffer()
+def count_file_bytes(file, data=None):
+    if data is None:
+        with open(file, 'rb') as f:
+            data = f.read()
+    return count_buffer(data, languages.language_of(file, data))
+
+
+# Function to count raw file contents with either classifier
+def count_data(file, data, fast=False):
+    return classify_data(data, languages.language_of(file, data), fast)
+
+
+# Function to classify raw contents with the comment syntax of a language, with either classifier
+def classify_data(data, language, fast=False):
+    if fast:
+        return count_buffer(data, language)
+    return count_text(iter_text_chunks(io.BytesIO(data)), language)
+
+
+# Function to hash file contents for deduplication (a fast non-cryptographic hash when available)
+def content_hash(data):
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+# Function to count raw contents once per distinct blob; blob_counts maps (language, hash) to the
+# counts of blobs already classified, since the comment syntax depends on the language.
+# Returns (counts, blob key, whether the blob was new)
+def count_deduplicated(file, data, blob_counts, fast=False):
+    language = languages.language_of(file, data)
+    key = (language['name'], content_hash(data))
+    counts = blob_counts.get(key)
+    if counts is not None:
+        return counts, key, False
+    counts = classify_data(data, language, fast)
+    blob_counts[key] = counts
+    return counts, key, True
+
+
+# Order in which the per-directory counts of the tree are stored
+tree_columns = ('total', 'code', 'comments')
+
+
+# Per-file counts written to the JSON Lines records, and the columns of the CSV summary
+record_columns = ('total', 'code', 'comments', 'blank')
+summary_columns = ('language', 'files') + record_columns
+
+
+# Default cap on the distinct languages (and file types) unknown to the language registry that are
+# given a row of their own in the statistics; files of any further one are counted under other_key,
+# so a tree full of extensionless or uniquely named files cannot grow the statistics without bound.
+# The rows go to the names that sort first, so the same tree gives the same report whatever order
+# its files are counted or merged in
+max_languages = 1000
+
+# Keys always given a row of their own, however many others were seen: there are only so many of
+# them
+known_languages = frozenset(languages.extension_languages) | frozenset(languages.filename_languages)
+
+# Name of the row collecting the languages over the cap
+other_key = '(other)'
+
+# Columns of the per-language statistics
+lang_columns = ('files',) + record_columns
+
+
+# Counters of a fixed set of columns per key, kept compact: each key is interned to a small ID the
+# first time it is seen and its counts are stored as one row of a flat array. At most max_keys keys
+# outside of known have a row: the ones that sort first, so that which keys those are does not
+# depend on the order they are seen in. A key that sorts after all of them is counted under
+# other_key, and one that sorts before the last of them takes its row, the counts of the key it
+# replaces moving to other_key. Rows read back as dictionaries, and a key without a row reads as zeros
+class CountTable:
+    def __init__(self, columns, max_keys=max_languages, known=known_languages):
+        self.columns = columns
+        self.max_keys = max_keys
+        self.known = known
+        self.unknown_keys = []  # the keys outside of known with a row, sorted
+        self.ids = {}
+        self.names = []
+        self.counts = array.array('q')
+
+    def intern(self, key):
+        width = len(self.columns)
+        if key not in self.known and key != other_key:
+            if self.max_keys is not None and len(self.unknown_keys) >= self.max_keys:
+                if not self.unknown_keys or key > self.unknown_keys[-1]:
+                    return self.intern(other_key)
+                # Move the counts of the last key to other_key and hand its row over to key
+                replaced = self.unknown_keys.pop()
+                key_id = self.ids.pop(replaced)
+                row = slice(key_id * width, (key_id + 1) * width)
+                self.add(other_key, self.counts[row])
+                self.counts[row] = array.array('q', bytes(8 * width))
+                self.ids[key] = key_id
+                self.names[key_id] = key
+                bisect.insort(self.unknown_keys, key)
+                return key_id
+            bisect.insort(self.unknown_keys, key)
+        key_id = self.ids.get(key)
+        if key_id is None:
+            key_id = self.ids[key] = len(self.names)
+            self.names.append(key)
+            self.counts.extend([0] * width)
+        return key_id
+
+    # Return the name the counts of key are kept under: key itself while it has a row, otherwise
+    # other_key
+    def canonical(self, key):
+        return key if key in self.ids else other_key
+
+    # Add a row of values to the counts of key; returns the name it was counted under, which a key
+    # that sorts first may later replace (see canonical())
+    def add(self, key, values):
+        key_id = self.ids.get(key)
+        if key_id is None:
+            key_id = self.intern(key)
+        counts = self.counts
+        for index, value in enumerate(values, key_id * len(self.columns)):
+            counts[index] += value
+        return self.names[key_id]
+
+    def merge(self, other):
+        width = len(other.columns)
+        for key_id, key in enumerate(other.names):
+            self.add(key, other.counts[key_id * width:(key_id + 1) * width])
+
+    def __getitem__(self, key):
+        key_id = self.ids.get(key)
+        if key_id is None:
+            return dict.fromkeys(self.columns, 0)
+        width = len(self.columns)
+        return dict(zip(self.columns, self.counts[key_id * width:(key_id + 1) * width]))
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def values(self):
+        return [self[key] for key in self.names]
+
+
+# Function to create an empty set of statistics; partial statistics are built per worker and merged.
+# max_languages caps the unknown languages and file types counted apart (None for no cap). The tree
+# holds a row per directory and language, so unlike the rest it grows with the number of directories;
+# without tree it is not kept (None)
+def new_stats(max_languages=max_languages, tree=True):
+    return {'tot_loc': 0, 'total_files_found': 0, 'file_type_counts': CountTable(('files',), max_languages),
+            'lang_stats': CountTable(lang_columns, max_languages), 'binary_files': 0, 'binary_bytes_skipped': 0,
+            'tree': {} if tree else None}
+
+
+# Function to add the counts of one file to a set of statistics
+def add_file_counts(stats, file, counts):
+    stats['tot_loc'] += counts['total']
+    stats['total_files_found'] += 1
+    stats['file_type_counts'].add(os.path.splitext(file)[1].lower(), (1,))
+    lang = stats['lang_stats'].add(get_lang(file), (1, counts['total'], counts['code'], counts['comments'], counts['blank']))
+    if stats['tree'] is None:
+        return
+    # Only the file's own directory is updated; subtrees are summed up by rollup_tree(). Nodes are
+    # keyed by the name the file was counted under, shared with the language table
+    node_counts = stats['tree'].setdefault(os.path.dirname(file), {}).setdefault(lang, [0] * len(tree_columns))
+    for index, column in enumerate(tree_columns):
+        node_counts[index] += counts[column]
+
+
+# Function to record a binary file skipped by content_sniffer, and the bytes it did not have to read
+def add_skipped_binary(stats, bytes_skipped):
+    stats['binary_files'] += 1
+    stats['binary_bytes_skipped'] += bytes_skipped
+
+
+# Function to merge partial statistics into the totals; languages over the cap of the totals are
+# counted under other_key there too, and the tree is dropped when the totals keep none
+def merge_stats(totals, partial):
+    totals['tot_loc'] += partial['tot_loc']
+    totals['total_files_found'] += partial['total_files_found']
+    totals['binary_files'] += partial['binary_files']
+    totals['binary_bytes_skipped'] += partial['binary_bytes_skipped']
+    totals['file_type_counts'].merge(partial['file_type_counts'])
+    lang_stats = totals['lang_stats']
+    lang_stats.merge(partial['lang_stats'])
+    if totals['tree'] is None:
+        return
+    for directory, node in partial['tree'].items():
+        total_node = totals['tree'].setdefault(directory, {})
+        for lang, counts in node.items():
+            total_counts = total_node.setdefault(lang_stats.canonical(lang), [0] * len(tree_columns))
+            for index, count in enumerate(counts):
+                total_counts[index] += count
+
+
+# Function to format the record of one file as a line of JSON; status is counted, cached, duplicate
+# or binary, and binary files carry their size instead of line counts
+def format_record(file, status, counts=None, size=None):
+    record = {'path': file, 'language': get_lang(file), 'status': status}
+    if counts is not None:
+        record.update((column, counts[column]) for column in record_columns)
+    if size is not None:
+        record['bytes'] = size
+    return json.dumps(record) + '\n'
+
+
+# Function to write the per-language statistics as CSV, one column per statistic, for bulk loading
+def create_summary_csv(csv_path, stats):
+    with open(csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(summary_columns)
+        for lang in sorted(stats['lang_stats']):
+            counts = stats['lang_stats'][lang]
+            writer.writerow([lang] + [counts[column] for column in summary_columns[1:]])
+
+
+# Function to sum the per-directory counts of a tree into every enclosing subtree below root. Returns
+# {node: {lang: [total, code, comments]}} keyed by '/'-separated paths relative to root ('.' for
+# root itself); an archive streamed in memory is a node of its own, named after the archive file.
+# Languages that lost their row in lang_stats to others over the cap are rolled up under other_key
+def rollup_tree(tree, root, lang_stats):
+    rollup = {}
+    for directory, node in tree.items():
+        relative = os.path.relpath(directory, root).replace('\\', '/')
+        parts = [] if relative == '.' else relative.split('/')
+        for depth in range(len(parts) + 1):
+            rolled_node = rollup.setdefault('/'.join(parts[:depth]) or '.', {})
+            for lang, counts in node.items():
+                rolled_counts = rolled_node.setdefault(lang_stats.canonical(lang), [0] * len(tree_columns))
+                for index, count in enumerate(counts):
+                    rolled_counts[index] += count
+    return rollup
+
+
+# Function to sum the per-language counts of a rolled up node into [total, code, comments]
+def node_totals(node):
+    return [sum(counts[index] for counts in node.values()) for index in range(len(tree_columns))]
+
+
+# Function to return the n subtrees below root with the most lines, as (node, totals) pairs
+def top_subtrees(rollup, n):
+    subtrees = [(path, node_totals(node)) for path, node in rollup.items() if path != '.']
+    subtrees.sort(key=lambda subtree: (-subtree[1][0], subtree[0]))
+    return subtrees[:n]
+
+
+# Function to describe a rolled up node as "<path>: <lines> lines [<code> code - <comments> comments]"
+def describe_node(path, totals):
+    kind = ' (archive)' if path.endswith(archive_extensions) else ''
+    return f"{path}{kind}: {totals[0]} lines [{totals[1]} code - {totals[2]} comments]"
+
+
+# Function to write the full rollup as an indented tree, with the per-language lines of every node
+def create_tree_report(tree_report_path, stats, root):
+    rollup = rollup_tree(stats['tree'], root, stats['lang_stats'])
+    with open(tree_report_path, 'w') as tree_file:
+        tree_file.write(f"Lines of code per subtree of {root}:\n\n")
+        # Sorting the paths lists every node right after its parent
+        for path in sorted(rollup, key=lambda path: [] if path == '.' else path.split('/')):
+            depth = 0 if path == '.' else path.count('/') + 1
+            node = rollup[path]
+            languages = ', '.join(f"{lang}: {node[lang][0]}" for lang in sorted(node))
+            name = path if path == '.' else path.rsplit('/', 1)[-1]
+            tree_file.write(f"{'  ' * depth}{describe_node(name, node_totals(node))} {{{languages}}}\n")
+
+
+# Function to generate the codebase report; unique_stats holds the statistics of distinct file
+# contents when deduplication is enabled. The heaviest top_n subtrees of the directory holding the
+# report are listed at the end
+def create_report(report_path, archive_types, stats, unique_stats=None, top_n=10):
+    tot_loc = stats['tot_loc']
+    lang_stats = stats['lang_stats']
+    file_type_counts = stats['file_type_counts']
+    with open(report_path, 'w') as report_file:
+        report_file.write(f"Total archives found: {sum(archive_types.values())}\n")
+        report_file.write("Archives by type:\n")
+        for ext, count in archive_types.items():
+            report_file.write(f"{ext}: {count}\n")
+
+        report_file.write(f"\nTotal files found: {stats['total_files_found']}\n")
+        report_file.write(f"Total lines of code found: {tot_loc}\n")
+        report_file.write(f"Total blank lines found: {sum(counts['blank'] for counts in lang_stats.values())}\n")
+        report_file.write(f"Binary files skipped: {stats['binary_files']} ({stats['binary_bytes_skipped']} bytes not read)\n\n")
+
+        report_file.write("Files of each type found:\n")
+        for ext in sorted(file_type_counts):
+            report_file.write(f"{ext}: {file_type_counts[ext]['files']}\n")
+
+        report_file.write("\nLanguage statistics:\n")
+        for lang in sorted(lang_stats):
+            count = lang_stats[lang]['total']
+            code_count = lang_stats[lang]['code']
+            comment_count = lang_stats[lang]['comments']
+            percentage = (count / tot_loc) * 100 if tot_loc > 0 else 0
+            report_file.write(
+                f"{lang}: {count} lines [{code_count} code - {comment_count} comments] ({percentage:.2f}%)\n")
+
+        if unique_stats is not None:
+            unique_loc = unique_stats['tot_loc']
+            unique_lang_stats = unique_stats['lang_stats']
+            report_file.write(f"\nUnique files found: {unique_stats['total_files_found']}\n")
+            report_file.write(f"Unique lines of code found: {unique_loc}\n")
+            report_file.write("\nUnique language statistics (raw -> unique):\n")
+            # The unique statistics are capped on their own; regroup their rows under those of the
+            # raw statistics, so that both sides of every line count the same languages
+            unique_rows = {}
+            for lang in unique_lang_stats:
+                counts = unique_rows.setdefault(lang_stats.canonical(lang), Counter())
+                counts.update(unique_lang_stats[lang])
+            for lang in sorted(unique_rows):
+                count = unique_rows[lang]['total']
+                code_count = unique_rows[lang]['code']
+                comment_count = unique_rows[lang]['comments']
+                percentage = (count / unique_loc) * 100 if unique_loc > 0 else 0
+                report_file.write(
+                    f"{lang}: {lang_stats[lang]['total']} -> {count} lines [{code_count} code - {comment_count} comments] ({percentage:.2f}%)\n")
+
+        if top_n > 0 and stats['tree']:
+            rollup = rollup_tree(stats['tree'], os.path.dirname(os.path.abspath(report_path)), lang_stats)
+            report_file.write(f"\nHeaviest subtrees (top {top_n}):\n")
+            for path, totals in top_subtrees(rollup, top_n):
+                report_file.write(f"{describe_node(path, totals)}\n")
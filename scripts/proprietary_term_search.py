@@ -1,8 +1,16 @@
 import os
+import re
+import mmap
 import zipfile
 import tarfile
 import sys
 import shutil
+import tempfile
+import argparse
+from collections import deque, Counter
+from multiprocessing import Pool
+
+import content_sniffer
 
 # Terms to search for
 LICENSE_TERMS = [
@@ -17,22 +25,225 @@ LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proprietary
 # Supported archive formats
 SUPPORTED_ARCHIVE_FORMATS = ['.tar', '.tar.gz', '.tar.bz2', '.tgz', '.zip']
 
+# Function to build an Aho-Corasick automaton matching all lowercased terms in a single pass. The
+# failure links are folded into a dense transition table, so scanning is one lookup per byte
+def build_automaton(terms):
+    patterns = [term.lower().encode('utf-8') for term in terms]
+    goto = [{}]
+    output = [[]]
+    for index, pattern in enumerate(patterns):
+        if not pattern:
+            continue  # an empty term would match at every byte; the other matchers skip it too
+        state = 0
+        for byte in pattern:
+            if byte not in goto[state]:
+                goto.append({})
+                output.append([])
+                goto[state][byte] = len(goto) - 1
+            state = goto[state][byte]
+        output[state].append(index)
+
+    # Breadth-first, so the row of a state's failure target is complete before the state's own row
+    transitions = [[goto[0].get(byte, 0) for byte in range(256)]]
+    transitions.extend([] for _ in range(len(goto) - 1))
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        row = list(transitions[fail[state]])
+        for byte, next_state in goto[state].items():
+            fail[next_state] = transitions[fail[state]][byte] if state else 0
+            output[next_state] = output[next_state] + output[fail[next_state]]
+            row[byte] = next_state
+            queue.append(next_state)
+        transitions[state] = row
+
+    # From the root state, jump straight to the next byte that can start a term; with no terms,
+    # there is none to jump to
+    first_bytes = sorted({pattern[0] for pattern in patterns if pattern})
+    skip = b'[' + b''.join(re.escape(bytes([byte])) for byte in first_bytes) + b']' if first_bytes else b'(?!)'
+    return {
+        'kind': 'aho-corasick',
+        'transitions': transitions,
+        'output': output,
+        'lengths': [len(pattern) for pattern in patterns],
+        'overlap': max(map(len, patterns), default=1) - 1,
+        'skip': re.compile(skip),
+    }
+
+# Function to build the fallback matcher: one compiled alternation, longest terms first, inside a
+# lookahead so hits starting at every offset are found (a term that is a prefix of a longer term
+# hit at the same offset is not reported)
+def build_regex_matcher(terms):
+    patterns = {}
+    for index, term in enumerate(terms):
+        if term:
+            patterns.setdefault(term.lower().encode('utf-8'), index)
+    # No terms at all gives a pattern that never matches
+    alternation = b'|'.join(re.escape(pattern) for pattern in sorted(patterns, key=len, reverse=True)) or b'(?!)'
+    return {'kind': 'regex', 'pattern': re.compile(b'(?=(' + alternation + b'))'), 'indexes': patterns,
+            'overlap': max(map(len, patterns), default=1) - 1}
+
+# Function to build the matcher for short term lists: each term is searched for on its own with
+# bytes.find(), which runs in C, so a pass per term still beats the automaton's loop over every byte
+def build_find_matcher(terms):
+    patterns = [term.lower().encode('utf-8') for term in terms]
+    return {'kind': 'find', 'patterns': patterns, 'overlap': max(map(len, patterns), default=1) - 1}
+
+# Term lists shorter than this are searched for term by term (see build_find_matcher()) by the auto
+# matcher, longer ones with the automaton. On Python sources, one find() pass per term runs at about
+# 150 MB/s for the 8 LICENSE_TERMS against 8 MB/s for the automaton, whose speed barely depends on
+# the number of terms; the two break even at around 200 terms
+find_max_terms = 128
+
+# Function to build a term matcher of the given kind; auto picks one by the number of terms
+def build_matcher(terms, kind='auto'):
+    if kind == 'auto':
+        kind = 'find' if len(terms) < find_max_terms else 'aho-corasick'
+    if kind == 'find':
+        return build_find_matcher(terms)
+    return build_regex_matcher(terms) if kind == 'regex' else build_automaton(terms)
+
+# Function to find every term hit in a lowercased chunk. Returns (hits, state): hits are (byte offset,
+# term index) pairs relative to the start of the chunk, negative for a hit that began in an earlier
+# chunk, and state is passed to the next call so terms split across chunks are still found
+def find_terms(matcher, lower_chunk, state=None):
+    if matcher['kind'] == 'regex':
+        # The regex cannot resume mid-term, so its state is an overlap window: the last bytes seen,
+        # one shorter than the longest term
+        tail = state or b''
+        buffer = tail + lower_chunk
+        indexes = matcher['indexes']
+        hits = []
+        for match in matcher['pattern'].finditer(buffer):
+            term = match.group(1)
+            # Hits that end inside the overlap window were found with the previous chunk
+            if match.start() + len(term) > len(tail):
+                hits.append((match.start() - len(tail), indexes[term]))
+        return hits, tail_bytes(buffer, matcher['overlap'])
+
+    if matcher['kind'] == 'find':
+        # Same overlap window as the regex matcher
+        tail = state or b''
+        buffer = tail + lower_chunk
+        hits = []
+        for index, pattern in enumerate(matcher['patterns']):
+            if not pattern:
+                continue
+            position = buffer.find(pattern)
+            while position >= 0:
+                if position + len(pattern) > len(tail):
+                    hits.append((position - len(tail), index))
+                position = buffer.find(pattern, position + 1)
+        return hits, tail_bytes(buffer, matcher['overlap'])
+
+    transitions = matcher['transitions']
+    output = matcher['output']
+    lengths = matcher['lengths']
+    skip = matcher['skip']
+    state = state or 0
+    hits = []
+    position = 0
+    end = len(lower_chunk)
+    while position < end:
+        if state == 0:
+            match = skip.search(lower_chunk, position)
+            if not match:
+                break
+            position = match.start()
+        state = transitions[state][lower_chunk[position]]
+        for index in output[state]:
+            hits.append((position - lengths[index] + 1, index))
+        position += 1
+    return hits, state
+
+# Function to return the last size bytes of data
+def tail_bytes(data, size):
+    return data[max(len(data) - size, 0):] if size else b''
+
+# Matcher used by search_in_chunks(), built once at startup (see --matcher)
+TERM_MATCHER = build_matcher(LICENSE_TERMS)
+
+# Size of the chunks files are read and searched in (see --chunk-size)
+CHUNK_SIZE = 1024 * 1024
+
+# Map local files into memory instead of reading them (see --mmap)
+USE_MMAP = False
+
+# Binary files skipped by the current task and the bytes they did not have to read
+BINARY_SKIPS = Counter()
+
+# Loose files smaller than this are searched together in one task (see --workers)
+TASK_BATCH_BYTES = 4 * 1024 * 1024
+
+# Function to start searching a file whose contents are then passed to search_chunk() in order, so
+# memory stays bounded by the chunk size whatever the size of the file
+def new_search(file_path, archive_path):
+    return {'file_path': file_path, 'archive_path': archive_path, 'hits': [], 'state': None,
+            'base': 0,        # offset of the next chunk in the file
+            'line': 1,        # line number at the start of the next chunk
+            'previous': b''}  # end of the previous chunks, for hits that began there
+
+# Function to search the next chunk of a file
+def search_chunk(search, chunk):
+    overlap = TERM_MATCHER['overlap']
+    hits = search['hits']
+    line = search['line']
+    previous = search['previous']
+    lower_chunk = chunk.lower()
+    chunk_hits, search['state'] = find_terms(TERM_MATCHER, lower_chunk, search['state'])
+    hit_line = line
+    counted = 0
+    for offset, index in sorted(chunk_hits):
+        if offset < 0:
+            hits.append((search['base'] + offset, index, line - previous.count(b'\n', len(previous) + offset)))
+            continue
+        hit_line += lower_chunk.count(b'\n', counted, offset)
+        counted = offset
+        hits.append((search['base'] + offset, index, hit_line))
+    search['line'] = line + lower_chunk.count(b'\n')
+    search['base'] += len(chunk)
+    search['previous'] = tail_bytes(previous + tail_bytes(lower_chunk, overlap), overlap)
+
+# Function to return the (term, file, archive, line, offset) of every hit found in a file
+def end_search(search):
+    return [(LICENSE_TERMS[index], search['file_path'], search['archive_path'], line, offset)
+            for offset, index, line in sorted(search['hits'])]
+
+# Function to search content delivered as a sequence of byte chunks
+def search_in_chunks(chunks, file_path, archive_path):
+    search = new_search(file_path, archive_path)
+    for chunk in chunks:
+        search_chunk(search, chunk)
+    return end_search(search)
+
 def search_in_content(content, file_path, archive_path):
-    found_terms = []
-    lower_content = content.lower()
-    for term in LICENSE_TERMS:
-        if term.lower() in lower_content:
-            found_terms.append((term, file_path, archive_path))
-    return found_terms
+    return search_in_chunks([content], file_path, archive_path)
+
+# Function to yield the contents of an open file in chunks, read through a read-only memory map when
+# USE_MMAP is set; head holds the bytes already read from the file
+def iter_file_chunks(f, head, chunk_size):
+    if USE_MMAP and os.fstat(f.fileno()).st_size:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), chunk_size):
+                yield mapped[start:start + chunk_size]
+        return
+    if head:
+        yield head
+    yield from iter(lambda: f.read(chunk_size), b'')
 
 def search_in_file(file_path, relative_path, archive_path):
     found_terms = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            found_terms = search_in_content(content, relative_path, archive_path)
-    except UnicodeDecodeError:
-        print(f"Skipping binary file: {file_path}")
+        with open(file_path, 'rb') as f:
+            # Binaries are recognised from the extension or the first few KB (see content_sniffer)
+            binary, head = content_sniffer.sniff_stream(file_path, f)
+            if binary:
+                BINARY_SKIPS['files'] += 1
+                BINARY_SKIPS['bytes'] += os.fstat(f.fileno()).st_size - len(head)
+                print(f"Skipping binary file: {file_path}")
+                return found_terms
+            found_terms = search_in_chunks(iter_file_chunks(f, head, CHUNK_SIZE), relative_path, archive_path)
     except Exception as e:
         print(f"Error reading file '{file_path}': {e}")
     return found_terms
@@ -64,50 +275,121 @@ def search_in_directory(directory, archive_root, archive_path):
                 found_terms_all.extend(found_terms)
     return found_terms_all
 
-def search_in_designated_directory(archives_dir):
-    found_terms_all = []
+# Function to search an archive in a scratch directory of its own, so archives can be searched in parallel
+def search_in_archive(archive_path):
+    tmp_dir = tempfile.mkdtemp(prefix='term_search_')
+    try:
+        extract_archive(archive_path, tmp_dir)
+        return search_in_directory(tmp_dir, tmp_dir, archive_path)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+# Function to split the search into tasks, each a list of (path, root) entries: one task per archive
+# or large file, with runs of small loose files batched together. Tasks keep the walk order
+def plan_tasks(archives_dir):
+    tasks = []
+    batch = []
+    batch_bytes = 0
     for root, _, files in os.walk(archives_dir):
         for file in files:
             archive_path = os.path.join(root, file)
-            if os.path.isfile(archive_path) and archive_path.endswith(tuple(SUPPORTED_ARCHIVE_FORMATS)):
-                tmp_dir = os.path.join(root, 'tmp')
-                os.makedirs(tmp_dir, exist_ok=True)
-                extract_archive(archive_path, tmp_dir)
-                found_terms = search_in_directory(tmp_dir, tmp_dir, archive_path)
-                print(f"Found terms: [{', '.join(term[0] for term in found_terms)}], Archive Path: {archive_path}")
-                found_terms_all.extend(found_terms)
-                shutil.rmtree(tmp_dir)
-            elif os.path.isfile(archive_path):
-                found_terms = search_in_file(archive_path, archive_path, root)
-                print(f"Found terms: [{', '.join(term[0] for term in found_terms)}], Archive Path: {archive_path}")
-                found_terms_all.extend(found_terms)
-            else:
+            if not os.path.isfile(archive_path):
                 print(f"Skipping '{archive_path}' as it is not a supported archive format.")
-    return found_terms_all
+                continue
+            size = os.path.getsize(archive_path)
+            if archive_path.endswith(tuple(SUPPORTED_ARCHIVE_FORMATS)) or size >= TASK_BATCH_BYTES:
+                if batch:
+                    tasks.append(batch)
+                    batch, batch_bytes = [], 0
+                tasks.append([(archive_path, root)])
+                continue
+            batch.append((archive_path, root))
+            batch_bytes += size
+            if batch_bytes >= TASK_BATCH_BYTES:
+                tasks.append(batch)
+                batch, batch_bytes = [], 0
+    if batch:
+        tasks.append(batch)
+    return tasks
+
+# Function to search the entries of one task; returns (path, found terms) for each entry and the
+# binary files skipped
+def search_task(entries):
+    BINARY_SKIPS.clear()
+    results = []
+    for archive_path, root in entries:
+        if archive_path.endswith(tuple(SUPPORTED_ARCHIVE_FORMATS)):
+            found_terms = search_in_archive(archive_path)
+        else:
+            found_terms = search_in_file(archive_path, archive_path, root)
+        results.append((archive_path, found_terms))
+    return results, Counter(BINARY_SKIPS)
 
-def write_report(found_terms):
+# Function to apply the search settings chosen on the command line; also run in every pool worker
+def configure_search(matcher_kind='auto', chunk_size=CHUNK_SIZE, use_mmap=USE_MMAP):
+    global TERM_MATCHER, CHUNK_SIZE, USE_MMAP
+    TERM_MATCHER = build_matcher(LICENSE_TERMS, matcher_kind)
+    CHUNK_SIZE = chunk_size
+    USE_MMAP = use_mmap
+
+# Function to search a directory; returns the found terms and the binary files skipped. Pool workers
+# are configured with settings, the arguments of configure_search(), or by default with the settings
+# this process searches with
+def search_in_designated_directory(archives_dir, workers=1, settings=None):
+    found_terms_all = []
+    binary_skips = Counter()
+    tasks = plan_tasks(archives_dir)
+    if workers > 1:
+        if settings is None:
+            settings = (TERM_MATCHER['kind'], CHUNK_SIZE, USE_MMAP)
+        with Pool(workers, initializer=configure_search, initargs=settings) as pool:
+            # map hands results back in task order, so the report does not depend on scheduling
+            results = pool.map(search_task, tasks, chunksize=1)
+    else:
+        results = map(search_task, tasks)
+    for task_results, task_binary_skips in results:
+        binary_skips.update(task_binary_skips)
+        for archive_path, found_terms in task_results:
+            print(f"Found terms: [{', '.join(term[0] for term in found_terms)}], Archive Path: {archive_path}")
+            found_terms_all.extend(found_terms)
+    return found_terms_all, binary_skips
+
+def write_report(found_terms, binary_skips=None):
     with open(LOG_FILE, 'w') as report_file:
         report_file.write("Proprietary Terms Statistics:\n\n")
         term_counts = {term: 0 for term in LICENSE_TERMS}
-        for term, file_path, archive_path in found_terms:
+        for term, file_path, archive_path, line, offset in found_terms:
             term_counts[term] += 1
-            report_file.write(f"Term: {term}, File: {file_path}, Archive: {archive_path}\n")
+            report_file.write(f"Term: {term}, File: {file_path}, Archive: {archive_path}, Line: {line}, Offset: {offset}\n")
         report_file.write("\nSummary:\n\n")
         total_count = sum(count for term, count in term_counts.items())  # Line to count all occurrences
         report_file.write(f"Found {total_count} occurrences\n")
         for term, count in term_counts.items():
             report_file.write(f"\t{term}: {count}\n")
+        if binary_skips is not None:
+            report_file.write(f"\nBinary files skipped: {binary_skips['files']} ({binary_skips['bytes']} bytes not read)\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python proprietary_term_search.py <base_search_directory>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Search files and archives for proprietary terms")
+    parser.add_argument("base_search_directory", help="Directory to search for files and archives")
+    parser.add_argument("--matcher", choices=["auto", "find", "aho-corasick", "regex"], default="auto", help="Multi-term matcher: one find() pass per term, a single-pass Aho-Corasick automaton or a compiled alternation regex (default: auto, find for fewer than 128 terms and the automaton otherwise)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Bytes read and searched at a time; memory per file stays bounded by this (default: 1 MiB)")
+    parser.add_argument("--mmap", action="store_true", help="Read local files through a memory map instead of read() calls")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes; each archive and each large file is searched as a separate task (default: 1)")
+
+    args = parser.parse_args()
 
-    base_search_directory = sys.argv[1]
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+    settings = (args.matcher, args.chunk_size, args.mmap)
+    configure_search(*settings)
+    base_search_directory = args.base_search_directory
     if not os.path.exists(base_search_directory):
         print(f"Error: {base_search_directory} does not exist.")
         sys.exit(1)
 
-    found_terms = search_in_designated_directory(base_search_directory)
-    write_report(found_terms)
+    found_terms, binary_skips = search_in_designated_directory(base_search_directory, args.workers, settings)
+    write_report(found_terms, binary_skips)
     print("Report generated successfully.")
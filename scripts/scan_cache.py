@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+
+# Persistent per-file statistics so repeated scans only re-count what changed. Loose files are keyed
+# by path, mtime and size (optionally verified by content hash); archives are keyed by the hash of
+# the archive itself, so an unchanged tarball is replayed from the cache without being opened.
+
+# Default name of the cache file, written next to codebase_report.txt
+cache_file_name = 'codebase_cache.sqlite'
+
+# Function to list the files of a cache at path: the database, and the journal SQLite keeps next to
+# it while a transaction is open
+def cache_files(path):
+    return path, path + '-journal'
+
+
+# Bump whenever the line classification or the stored records change so entries from older versions
+# are discarded
+cache_version = '4'
+
+# Order in which per-file counts are stored
+count_columns = ('total', 'code', 'comments', 'blank')
+
+cache_schema = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT,
+    total INTEGER, code INTEGER, comments INTEGER, blank INTEGER, last_seen INTEGER);
+CREATE TABLE IF NOT EXISTS archive_paths (
+    path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT, last_seen INTEGER);
+CREATE TABLE IF NOT EXISTS archives (hash TEXT PRIMARY KEY, contents TEXT, last_seen INTEGER);
+'''
+
+
+# Function to hash the contents of a file
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to open (or create) a cache; entries not seen during this run are pruned by close_cache()
+def open_cache(path, verify_hash=False):
+    connection = sqlite3.connect(path)
+    connection.executescript(cache_schema)
+    row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if row is None or row[0] != cache_version:
+        connection.executescript('DELETE FROM files; DELETE FROM archive_paths; DELETE FROM archives;')
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (cache_version,))
+    row = connection.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+    run = int(row[0]) + 1 if row else 1
+    connection.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (str(run),))
+    return {'connection': connection, 'run': run, 'verify_hash': verify_hash, 'hits': 0, 'misses': 0}
+
+
+# Function to return the cached counts of an unchanged file, or None when it has to be counted
+def lookup_file(cache, path):
+    stat = os.stat(path)
+    row = cache['connection'].execute(
+        'SELECT hash, total, code, comments, blank FROM files WHERE path = ? AND mtime_ns = ? AND size = ?',
+        (path, stat.st_mtime_ns, stat.st_size)).fetchone()
+    if row is not None and cache['verify_hash'] and row[0] != hash_file(path):
+        row = None
+    if row is None:
+        cache['misses'] += 1
+        return None
+    cache['hits'] += 1
+    cache['connection'].execute('UPDATE files SET last_seen = ? WHERE path = ?', (cache['run'], path))
+    return Counter(dict(zip(count_columns, row[1:])))
+
+
+# Function to store the counts of a file
+def store_file(cache, path, counts):
+    stat = os.stat(path)
+    digest = hash_file(path) if cache['verify_hash'] else None
+    cache['connection'].execute(
+        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (path, stat.st_mtime_ns, stat.st_size, digest, *(counts[column] for column in count_columns), cache['run']))
+
+
+# Function to look up an archive by content hash; returns (hash, contents) where contents is None on a miss
+def lookup_archive(cache, path):
+    connection = cache['connection']
+    stat = os.stat(path)
+    row = connection.execute('SELECT hash FROM archive_paths WHERE path = ? AND mtime_ns = ? AND size = ?',
+                             (path, stat.st_mtime_ns, stat.st_size)).fetchone()
+    # Only hash archives that moved or changed on disk, unless every hit has to be verified
+    digest = row[0] if row is not None and not cache['verify_hash'] else hash_file(path)
+    connection.execute('INSERT OR REPLACE INTO archive_paths VALUES (?, ?, ?, ?, ?)',
+                       (path, stat.st_mtime_ns, stat.st_size, digest, cache['run']))
+    row = connection.execute('SELECT contents FROM archives WHERE hash = ?', (digest,)).fetchone()
+    if row is None:
+        cache['misses'] += 1
+        return digest, None
+    cache['hits'] += 1
+    connection.execute('UPDATE archives SET last_seen = ? WHERE hash = ?', (cache['run'], digest))
+    return digest, json.loads(row[0])
+
+
+# Function to store the statistics of an archive: one [member path, *count_columns] record per counted
+# member (nested archives included) and the archive types found inside it. Member paths are relative
+# to the archive, so a copy of the same archive found elsewhere is replayed under its own path
+def store_archive(cache, digest, records, archive_types):
+    contents = json.dumps({'files': records, 'archive_types': archive_types})
+    cache['connection'].execute('INSERT OR REPLACE INTO archives VALUES (?, ?, ?)', (digest, contents, cache['run']))
+
+
+# Function to turn a stored archive record back into (member path, counts), the member path under
+# archive_path
+def unpack_record(record, archive_path):
+    return f"{archive_path}/{record[0]}", Counter(dict(zip(count_columns, record[1:])))
+
+
+# Function to drop entries for files and archives that no longer exist and write the cache
+def close_cache(cache):
+    connection = cache['connection']
+    for table in ('files', 'archive_paths', 'archives'):
+        connection.execute(f'DELETE FROM {table} WHERE last_seen < ?', (cache['run'],))
+    connection.commit()
+    connection.close()
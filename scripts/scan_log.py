@@ -0,0 +1,144 @@
+import logging
+import logging.handlers
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows; log_peak_rss() then logs nothing
+    resource = None
+
+# Logging shared by the scanners. Per-file messages are logged at DEBUG, so at the default INFO level
+# the terminal only sees archives, errors and a periodic progress line. Pool workers buffer their
+# records and send them to the parent in batches, where a single listener thread writes them.
+
+logger = logging.getLogger('codestatistics')
+
+# Levels accepted by --log-level
+log_levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# Number of records a worker buffers before sending them to the parent
+worker_batch_size = 256
+
+# Seconds between two progress lines
+progress_interval = 5.0
+
+
+# Handler buffering records and putting each batch on a queue as a single item; errors are sent at once
+class BatchQueueHandler(logging.handlers.BufferingHandler):
+    def __init__(self, queue, capacity=worker_batch_size):
+        super().__init__(capacity)
+        self.queue = queue
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or record.levelno >= logging.ERROR
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                self.queue.put([prepare_record(record) for record in self.buffer])
+                self.buffer = []
+        finally:
+            self.release()
+
+
+# Listener writing the batches put on the queue by BatchQueueHandler
+class BatchQueueListener(logging.handlers.QueueListener):
+    def handle(self, batch):
+        for record in batch:
+            super().handle(record)
+
+
+# Function to make a record picklable: the message is formatted and the traceback turned into text
+def prepare_record(record):
+    message = record.getMessage()
+    if record.exc_info:
+        message = f"{message}\n{logging.Formatter().formatException(record.exc_info)}"
+    record.msg = message
+    record.args = None
+    record.exc_info = None
+    return record
+
+
+# Function to create the handlers writing INFO and below to stdout and warnings and errors to stderr
+def create_handlers():
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setLevel(logging.WARNING)
+    return [stdout_handler, stderr_handler]
+
+
+# Function to configure logging in the main process; quiet only lets warnings and errors through
+def setup_logging(level='INFO', quiet=False):
+    logger.setLevel(logging.WARNING if quiet else level)
+    logger.handlers = create_handlers()
+    logger.propagate = False
+
+
+# Function to start the thread writing the records that pool workers put on the queue
+def start_worker_listener(queue):
+    listener = BatchQueueListener(queue, *create_handlers(), respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+# Function to configure logging in a pool worker (used as the pool initializer)
+def setup_worker_logging(queue, level):
+    logger.setLevel(level)
+    logger.handlers = [BatchQueueHandler(queue)]
+    logger.propagate = False
+
+
+# Function to send the records a worker has buffered so far
+def flush_worker_logging():
+    for handler in logger.handlers:
+        handler.flush()
+
+
+# Function to create a progress tracker; with the total number of bytes to scan it also estimates the
+# time left
+def new_progress(total_bytes=None):
+    start = time.monotonic()
+    return {'start': start, 'last': start, 'files': 0, 'bytes': 0, 'total_bytes': total_bytes}
+
+
+# Function to record scanned files and bytes, logging a progress line every progress_interval seconds
+def advance_progress(progress, files=0, size=0):
+    if progress is None:
+        return
+    progress['files'] += files
+    progress['bytes'] += size
+    now = time.monotonic()
+    if now - progress['last'] >= progress_interval:
+        progress['last'] = now
+        log_progress(progress)
+
+
+# Function to log the files/s and MB/s rates and, when the total is known, the estimated time left
+def log_progress(progress):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    elapsed = max(time.monotonic() - progress['start'], 1e-9)
+    byte_rate = progress['bytes'] / elapsed
+    line = (f"Progress: {progress['files']} files, {progress['bytes'] / 1e6:.1f} MB "
+            f"({progress['files'] / elapsed:.0f} files/s, {byte_rate / 1e6:.1f} MB/s)")
+    total_bytes = progress['total_bytes']
+    if total_bytes and byte_rate > 0:
+        remaining = max(total_bytes - progress['bytes'], 0) / byte_rate
+        line += f", {100 * progress['bytes'] / total_bytes:.0f}% done, ETA {remaining:.0f}s"
+    logger.info(line)
+
+
+# Function to log the peak resident set size of this process and, with children, of the largest of
+# the worker processes it waited for
+def log_peak_rss(children=False):
+    if resource is None:
+        return
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    scale = 1 if sys.platform == 'darwin' else 1024
+    line = f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6:.1f} MB"
+    if children:
+        line += f", largest worker {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1e6:.1f} MB"
+    logger.info(line)
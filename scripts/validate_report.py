@@ -0,0 +1,96 @@
+import re
+import sys
+from collections import Counter
+
+# Compares codebase reports written by code_statistics.py or code_statistics_multiprocessing.py
+# against the ground truth written by create_random_files.py (generation_statistics.txt).
+
+total_files_pattern = re.compile(r'^Total files (?:found|created): (\d+)$')
+total_loc_pattern = re.compile(r'^Total lines of code (?:found|generated): (\d+)$')
+file_type_pattern = re.compile(r'^(.*): (\d+)$')
+language_pattern = re.compile(r'^(.*): (\d+) lines(?: \[(\d+) code - (\d+) comments\])? \(')
+
+
+# Function to fold extensionless entries into the '' key; reports key them by file name
+def normalize_key(key):
+    return key if key.startswith('.') else ''
+
+
+# Function to parse a report or generation statistics file into comparable totals
+def parse_report(path):
+    parsed = {'total_files': None, 'total_loc': None, 'file_types': Counter(), 'languages': {}}
+    section = None
+    with open(path, 'r') as report_file:
+        for line in report_file:
+            line = line.rstrip('\n')
+            if not line:
+                section = None
+                continue
+            if line.startswith('Files of each type'):
+                section = 'file_types'
+                continue
+            if line.startswith('Language statistics'):
+                section = 'languages'
+                continue
+            match = total_files_pattern.match(line)
+            if match:
+                parsed['total_files'] = int(match.group(1))
+                continue
+            match = total_loc_pattern.match(line)
+            if match:
+                parsed['total_loc'] = int(match.group(1))
+                continue
+            if section == 'file_types':
+                match = file_type_pattern.match(line)
+                if match:
+                    parsed['file_types'][normalize_key(match.group(1))] += int(match.group(2))
+            elif section == 'languages':
+                match = language_pattern.match(line)
+                if match:
+                    counts = parsed['languages'].setdefault(normalize_key(match.group(1)), Counter())
+                    counts['total'] += int(match.group(2))
+                    # Older multiprocessing reports carry totals only
+                    if match.group(3) is not None:
+                        counts['code'] += int(match.group(3))
+                        counts['comments'] += int(match.group(4))
+    return parsed
+
+
+# Function to list the differences between the expected and the reported statistics
+def compare_reports(expected, actual):
+    mismatches = []
+    for key in ('total_files', 'total_loc'):
+        if expected[key] != actual[key]:
+            mismatches.append(f"{key}: expected {expected[key]}, found {actual[key]}")
+    for ext in sorted(set(expected['file_types']) | set(actual['file_types'])):
+        if expected['file_types'][ext] != actual['file_types'][ext]:
+            mismatches.append(f"files of type '{ext}': expected {expected['file_types'][ext]}, found {actual['file_types'][ext]}")
+    for ext in sorted(set(expected['languages']) | set(actual['languages'])):
+        expected_counts = expected['languages'].get(ext, Counter())
+        actual_counts = actual['languages'].get(ext, Counter())
+        for column in ('total', 'code', 'comments'):
+            if column != 'total' and column not in actual_counts:
+                continue
+            if expected_counts[column] != actual_counts[column]:
+                mismatches.append(f"{column} lines of '{ext}': expected {expected_counts[column]}, found {actual_counts[column]}")
+    return mismatches
+
+
+# Main script execution
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python validate_report.py <generation_statistics.txt> <codebase_report.txt> [<codebase_report.txt> ...]")
+        sys.exit(1)
+
+    expected = parse_report(sys.argv[1])
+    failed = False
+    for report_path in sys.argv[2:]:
+        mismatches = compare_reports(expected, parse_report(report_path))
+        if mismatches:
+            failed = True
+            print(f"FAIL {report_path}")
+            for mismatch in mismatches:
+                print(f"\t{mismatch}")
+        else:
+            print(f"OK   {report_path}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,50 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import loc_counter
+
+
+# Function to return the rows of a table as a plain dictionary
+def table_rows(table):
+    return {key: table[key] for key in table}
+
+
+class CountTableTest(unittest.TestCase):
+    # The keys given a row under the cap, and the counts under other_key, do not depend on the
+    # order the keys are added or merged in
+    def test_cap_does_not_depend_on_order(self):
+        keys = [f'.x{index}' for index in range(30)] * 3 + ['.c', '.py']
+        results = []
+        for seed in range(5):
+            shuffled = random.Random(seed).sample(keys, len(keys))
+            # Serially, and through uncapped partial tables merged in batches of 7
+            serial = loc_counter.CountTable(('files',), 5)
+            merged = loc_counter.CountTable(('files',), 5)
+            for start in range(0, len(shuffled), 7):
+                partial = loc_counter.CountTable(('files',), None)
+                for key in shuffled[start:start + 7]:
+                    serial.add(key, (1,))
+                    partial.add(key, (1,))
+                merged.merge(partial)
+            results.append(table_rows(serial))
+            results.append(table_rows(merged))
+        for rows in results:
+            self.assertEqual(rows, results[0])
+        self.assertEqual(sorted(results[0]), sorted(['(other)', '.c', '.py', '.x0', '.x1', '.x10', '.x11', '.x12']))
+        self.assertEqual(results[0]['(other)']['files'], 25 * 3)
+
+    # A name a file was counted under reads back under other_key once a key sorting first takes its row
+    def test_replaced_key_is_canonical_under_other(self):
+        table = loc_counter.CountTable(('files',), 1)
+        self.assertEqual(table.add('.b', (2,)), '.b')
+        self.assertEqual(table.add('.a', (1,)), '.a')
+        self.assertEqual(table.canonical('.b'), loc_counter.other_key)
+        self.assertEqual(table_rows(table), {'.a': {'files': 1}, '(other)': {'files': 2}})
+
+
+if __name__ == '__main__':
+    unittest.main()
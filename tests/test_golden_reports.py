@@ -0,0 +1,55 @@
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+sys.path.insert(0, scripts_dir)
+
+import create_random_files
+import validate_report
+
+# Scanner command lines checked against the generated ground truth; each runs on its own copy of
+# the corpus, as extracting archives in place changes the tree
+scanner_commands = {
+    'serial': ['code_statistics.py'],
+    'stream': ['code_statistics.py', '--stream'],
+    'stream-fast': ['code_statistics.py', '--stream', '--fast'],
+    'multiprocessing': ['code_statistics_multiprocessing.py', '--cpus', '2'],
+    'multiprocessing-fast': ['code_statistics_multiprocessing.py', '--cpus', '2', '--fast'],
+}
+
+
+class GoldenReportTest(unittest.TestCase):
+    # Generate a small fixed-seed corpus, with its ground truth, once for every scanner
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        cls.tree_dir = os.path.join(cls.work_dir, 'tree')
+        num_subdirs, files_per_directory, max_depth = 3, 10, 2
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            statistics = create_random_files.create_files_in_directory(cls.tree_dir, num_subdirs, files_per_directory, max_depth, seed=0, in_memory=True)
+        cls.statistics_path = os.path.join(cls.work_dir, 'generation_statistics.txt')
+        create_random_files.write_statistics_to_file(statistics, cls.statistics_path, cls.tree_dir, num_subdirs, files_per_directory, max_depth)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    # Every scanner reports exactly the files and lines the generator wrote
+    def test_reports_match_generated_statistics(self):
+        expected = validate_report.parse_report(self.statistics_path)
+        for name, command in scanner_commands.items():
+            with self.subTest(scanner=name):
+                search_dir = os.path.join(self.work_dir, name)
+                shutil.copytree(self.tree_dir, search_dir)
+                subprocess.run([sys.executable] + command + [search_dir, '--quiet'], cwd=scripts_dir, check=True)
+                actual = validate_report.parse_report(os.path.join(search_dir, 'codebase_report.txt'))
+                self.assertEqual(validate_report.compare_reports(expected, actual), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
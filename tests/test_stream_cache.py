@@ -0,0 +1,49 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+
+# Function to write a tar.gz holding a single C file, always with the same bytes
+def write_archive(path):
+    data = b'int main(void) {\n    // entry point\n    return 0;\n}\n'
+    info = tarfile.TarInfo('src/m.c')
+    info.size = len(data)
+    info.mtime = 0
+    with open(path, 'wb') as f, tarfile.open(fileobj=f, mode='w:gz') as tar:
+        tar.addfile(info, io.BytesIO(data))
+
+
+class StreamCacheTest(unittest.TestCase):
+    # Identical archives share one cache entry, but their members are reported under each copy
+    def test_identical_archives_keep_their_own_paths(self):
+        with tempfile.TemporaryDirectory() as root:
+            for directory in ('a', 'b'):
+                os.makedirs(os.path.join(root, directory))
+                write_archive(os.path.join(root, directory, 'lib.tar.gz'))
+            jsonl_path = os.path.join(root, 'files.jsonl')
+            reports = []
+            for _ in range(2):  # counted, then replayed from the cache
+                subprocess.run([sys.executable, 'code_statistics.py', root, '--stream', '--cache', '--jsonl', jsonl_path, '--tree', '--quiet'],
+                               cwd=scripts_dir, check=True)
+                with open(jsonl_path) as jsonl_file:
+                    paths = sorted(record['path'] for record in map(json.loads, jsonl_file))
+                self.assertEqual(paths, [os.path.join(root, 'a', 'lib.tar.gz', 'src', 'm.c'),
+                                         os.path.join(root, 'b', 'lib.tar.gz', 'src', 'm.c')])
+                with open(os.path.join(root, 'codebase_tree.txt')) as tree_file:
+                    tree = tree_file.read()
+                self.assertIn('  a: 4 lines', tree)
+                self.assertIn('  b: 4 lines', tree)
+                with open(os.path.join(root, 'codebase_report.txt')) as report_file:
+                    reports.append(report_file.read())
+            # The reports, records and cache of the first run are not counted by the second
+            self.assertEqual(reports[1], reports[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import os
+import sys
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import languages
+import loc_counter
+
+
+# Function to return the counts the classifiers should agree on for a number of code, comment
+# and blank lines
+def expected_counts(code, comments, blank):
+    return Counter(total=code + comments, code=code, comments=comments, blank=blank)
+
+
+class TokenizerTest(unittest.TestCase):
+    # Count source line by line, on its raw bytes and through text chunks small enough to split
+    # its comments and strings, and check all three give the expected counts
+    def assertCounts(self, source, extension, code, comments, blank=0):
+        language = languages.extension_languages[extension]
+        data = source.encode('utf-8')
+        expected = expected_counts(code, comments, blank)
+        self.assertEqual(loc_counter.count_lines(source.splitlines(), language), expected)
+        self.assertEqual(loc_counter.count_buffer(data, language), expected)
+        self.assertEqual(loc_counter.count_text(loc_counter.iter_text_chunks(io.BytesIO(data), chunk_size=4), language), expected)
+
+    def test_block_closed_on_the_line_it_opens(self):
+        self.assertCounts('/* one */\n/* two */ /* three */\n\nint x; /* four */\n', '.c', code=1, comments=2, blank=1)
+
+    def test_code_after_closing_marker(self):
+        self.assertCounts('/* one */ int x;\n/* two\n   three */ int y;\n/* four\n */\n', '.c', code=2, comments=3)
+
+    def test_markers_inside_strings(self):
+        source = ('char *a = "/* not a comment";\n'
+                  'char *b = "// nor this";\n'
+                  "char c = '\"'; // a comment after code\n"
+                  '// "a string inside a comment\n'
+                  'int d;\n')
+        self.assertCounts(source, '.c', code=4, comments=1)
+
+    def test_nested_rust_blocks(self):
+        source = ('/* outer /* inner */ still outer */\n'
+                  '/* outer\n'
+                  '   /* inner */\n'
+                  '   still outer */ fn f() {}\n'
+                  'let s = "/*"; // not opened\n')
+        self.assertCounts(source, '.rs', code=2, comments=3)
+
+    def test_nested_haskell_blocks(self):
+        source = ('{- outer {- inner -}\n'
+                  '   still outer -}\n'
+                  'main = pure () -- after code\n'
+                  '-- {- not opened\n'
+                  'x = 1\n')
+        self.assertCounts(source, '.hs', code=2, comments=3)
+
+    # Triple quotes are a docstring where nothing but comments precede them, and a string anywhere
+    # else, however many lines either spans
+    def test_python_docstring_and_string(self):
+        source = ('def f():\n'
+                  '    """A docstring\n'
+                  '    on two lines."""\n'
+                  '    text = """a string\n'
+                  '    on two lines"""\n'
+                  "    '''A docstring on one line'''\n"
+                  '    return text  # """not a docstring\n'
+                  "s = '# not a comment'\n")
+        self.assertCounts(source, '.py', code=5, comments=3)
+
+    # The bytes counter splits lines on \n only, so a file with a lone \r is decoded as text instead
+    def test_lone_carriage_return_falls_back_to_text(self):
+        data = b'int x;\r/* a comment */\rint y;\n'
+        language = languages.extension_languages['.c']
+        expected = expected_counts(2, 1, 0)
+        self.assertEqual(loc_counter.count_buffer(data, language), expected)
+        self.assertEqual(loc_counter.count_text(loc_counter.iter_text_chunks(io.BytesIO(data)), language), expected)
+
+    # Only ASCII whitespace is blank on raw bytes, so a line of a no-break space is code there
+    def test_no_break_space_is_blank_only_in_text(self):
+        source = 'int x;\n\xa0\n'
+        language = languages.extension_languages['.c']
+        self.assertEqual(loc_counter.count_lines(source.splitlines(), language), expected_counts(1, 0, 1))
+        self.assertEqual(loc_counter.count_buffer(source.encode('utf-8'), language), expected_counts(2, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()